@@ -1,25 +1,355 @@
+"""Load test for the REST and websocket hot paths.
+
+Simulates N concurrent users: each one signs up (or reuses its account),
+logs in through /api/auth/token, joins one of the given chats over the
+websocket and sends text messages at a fixed rate. The socket only
+accepts members of the chat, so the virtual users' accounts have to be
+added to the chats beforehand. Every message carries
+a nonce, so both the sender's own echo and every other member's copy can
+be matched back to the moment it was sent.
+
+    python client.py --users 50 --chats 1,2 --rate 2 --duration 30 --output bench.json
+
+Results (throughput and p50/p95/p99 per metric) are printed and written
+as JSON, so two runs can be diffed to spot regressions.
+
+/signup and /token are rate limited per IP (a burst of 10, then 30 per
+minute by default), and all virtual users share one IP. Auth calls that
+get a 429 wait for Retry-After and try again up to --auth-retries times,
+which stretches the setup of a large run. To bench without that, start
+the server with the auth limits off:
+
+    AUTH_IP_RATE_PER_MINUTE=0 AUTH_LOGIN_RATE_PER_MINUTE=0 uvicorn main:app
+"""
+import argparse
 import asyncio
-import websockets
-import json
 import datetime
+import json
+import math
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import httpx
+import websockets
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+SUBPROTOCOLS = {
+    "json": ["chat.json"],
+    "msgpack": ["chat.msgpack", "chat.json"],
+}
+
+
+def encode(data: dict, subprotocol: str):
+    if subprotocol == "chat.msgpack":
+        return msgpack.packb(data, use_bin_type=True)
+    return json.dumps(data)
+
+
+def decode(frame):
+    # Бинарные фреймы - msgpack, текстовые - JSON
+    if isinstance(frame, bytes):
+        return msgpack.unpackb(frame, raw=False)
+    return json.loads(frame)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    index = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+class Stats:
+    """Latency samples in milliseconds, grouped by metric name."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.retries: Dict[str, int] = {} # 429 answers that were waited out
+
+    def record(self, name: str, started: float):
+        self.samples.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+
+    def error(self, name: str):
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def throttled(self, name: str):
+        self.retries[name] = self.retries.get(name, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        result = {}
+        for name, values in self.samples.items():
+            result[name] = {
+                "count": len(values),
+                "errors": self.errors.get(name, 0),
+                "rate_limited": self.retries.get(name, 0),
+                "throughput_per_second": len(values) / elapsed if elapsed else 0.0,
+                "mean_ms": sum(values) / len(values),
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "p99_ms": percentile(values, 99),
+                "max_ms": max(values),
+            }
+        for name, count in self.errors.items():
+            result.setdefault(name, {"count": 0, "errors": count})
+
+        return result
+
+
+@dataclass
+class InFlight:
+    sent_at: float
+    chat_id: int
+    pending: int # members that still have to receive it, the sender included
+
+
+@dataclass
+class VirtualUser:
+    login: str
+    chat_id: int
+    user_id: Optional[int] = None
+    token: Optional[str] = None
+    received: int = 0
+
+
+@dataclass
+class Benchmark:
+    args: argparse.Namespace
+    stats: Stats = field(default_factory=Stats)
+    in_flight: Dict[str, InFlight] = field(default_factory=dict)
+    members: Dict[int, int] = field(default_factory=dict)
+    sent: int = 0
+
+    async def post_auth(self, client: httpx.AsyncClient, name: str, path: str, body: dict) -> Tuple[httpx.Response, float]:
+        """POSTs to a rate limited auth route, waiting out 429s. Returns the response and when its attempt started."""
+        for attempt in range(self.args.auth_retries + 1):
+            started = time.perf_counter()
+            response = await client.post(path, json=body)
+            if response.status_code != 429 or attempt == self.args.auth_retries:
+                break
+
+            self.stats.throttled(name)
+            await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+
+        return response, started
 
-async def send_message():
-    uri = "ws://127.0.0.1:8000/api/chat/ws/chat?chat_id=0&user_id=0"  # URL вашего WebSocket сервера
-    async with websockets.connect(uri) as websocket:
-        message = {
-            "chat_id": 0,
-            "user_id": 0,
-            "message": "Hello, FastAPI WebSocket!",
-            "data_type": "text",
-            "created_at": str(datetime.datetime.now(datetime.timezone.utc)),
-            "updated_at": str(datetime.datetime.now(datetime.timezone.utc)),
+    async def authenticate(self, client: httpx.AsyncClient, user: VirtualUser):
+        phone = f"+380{zlib.crc32(user.login.encode()) % 10**9:09d}"
+        response, started = await self.post_auth(client, "auth_signup", "/api/auth/signup", {
+            "login": user.login,
+            "password": self.args.password,
+            "phone_num": phone,
+            "is_active": True,
+            "is_admin": False,
+        })
+        # 400 means the account is left over from a previous run
+        if response.status_code in (200, 400):
+            self.stats.record("auth_signup", started)
+        else:
+            self.stats.error("auth_signup")
+
+        response, started = await self.post_auth(client, "auth_token", "/api/auth/token", {"login": user.login, "password": self.args.password})
+        if response.status_code != 200:
+            self.stats.error("auth_token")
+            raise RuntimeError(f"Login failed for {user.login}: {response.status_code} {response.text}")
+        self.stats.record("auth_token", started)
+        user.token = response.json()["access_token"]
+
+        started = time.perf_counter()
+        response = await client.get("/api/auth/me", headers={"Authorization": f"Bearer {user.token}"})
+        if response.status_code != 200:
+            self.stats.error("auth_me")
+            raise RuntimeError(f"/me failed for {user.login}: {response.status_code}")
+        self.stats.record("auth_me", started)
+        user.user_id = response.json()["id"]
+
+    async def receive(self, websocket, user: VirtualUser):
+        async for frame in websocket:
+            data = decode(frame)
+            nonce = data.get("nonce")
+            flight = self.in_flight.get(nonce) if nonce else None
+            if flight is None:
+                continue
+
+            user.received += 1
+            if data.get("client_id") == user.login:
+                self.stats.record("send_to_deliver", flight.sent_at)
+            else:
+                self.stats.record("fanout_recipient", flight.sent_at)
+
+            flight.pending -= 1
+            if flight.pending <= 0:
+                # Last member got it, the whole broadcast is done
+                self.stats.record("fanout_complete", flight.sent_at)
+                self.in_flight.pop(nonce, None)
+
+    async def send(self, websocket, user: VirtualUser, deadline: float):
+        interval = 1 / self.args.rate
+        next_send = time.perf_counter()
+
+        while next_send < deadline:
+            nonce = uuid.uuid4().hex
+            now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            message = {
+                "data_type": "text",
+                "message": f"bench {user.login} {self.sent}",
+                "nonce": nonce,
+                "client_id": user.login,
+                "created_at": now,
+                "updated_at": now,
+            }
+
+            self.in_flight[nonce] = InFlight(time.perf_counter(), user.chat_id, self.members[user.chat_id])
+            await websocket.send(encode(message, websocket.subprotocol))
+            self.sent += 1
+
+            next_send += interval
+            await asyncio.sleep(max(next_send - time.perf_counter(), 0))
+
+    async def run_user(self, user: VirtualUser, ready: asyncio.Barrier):
+        ws_url = self.args.host.replace("http", "ws", 1)
+        uri = f"{ws_url}/api/chat/ws/chat?{urlencode({'chat_id': user.chat_id, 'token': user.token})}"
+
+        started = time.perf_counter()
+        try:
+            websocket = await websockets.connect(uri, subprotocols=SUBPROTOCOLS[self.args.encoding])
+        except Exception:
+            self.stats.error("ws_connect")
+            # Still pass the barrier so the others are not left waiting, just without this member
+            self.members[user.chat_id] -= 1
+            await ready.wait()
+            raise
+        self.stats.record("ws_connect", started)
+
+        async with websocket:
+            receiver = asyncio.create_task(self.receive(websocket, user))
+            # Nobody sends before every member is connected, otherwise fan-out would undercount
+            await ready.wait()
+
+            await self.send(websocket, user, time.perf_counter() + self.args.duration)
+            await asyncio.sleep(self.args.drain)
+
+            receiver.cancel()
+            try:
+                await receiver
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self) -> dict:
+        chats = [int(chat_id) for chat_id in self.args.chats.split(",")]
+        users = [VirtualUser(f"{self.args.prefix}{index}", chats[index % len(chats)]) for index in range(self.args.users)]
+
+        limits = httpx.Limits(max_connections=self.args.concurrency)
+        async with httpx.AsyncClient(base_url=self.args.host, limits=limits, timeout=30) as client:
+            semaphore = asyncio.Semaphore(self.args.concurrency)
+
+            async def authenticate(user: VirtualUser):
+                async with semaphore:
+                    await self.authenticate(client, user)
+
+            results = await asyncio.gather(*(authenticate(user) for user in users), return_exceptions=True)
+
+        failed = [repr(result) for result in results if isinstance(result, Exception)]
+        users = [user for user in users if user.user_id is not None]
+        if not users:
+            raise RuntimeError(f"No user could log in: {failed[:1]}")
+
+        self.members = {}
+        for user in users:
+            self.members[user.chat_id] = self.members.get(user.chat_id, 0) + 1
+
+        ready = asyncio.Barrier(len(users) + 1)
+        tasks = [asyncio.create_task(self.run_user(user, ready)) for user in users]
+
+        await ready.wait()
+        started = time.perf_counter()
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - started - self.args.drain
+        failed += [repr(result) for result in results if isinstance(result, Exception)]
+
+        delivered = sum(user.received for user in users)
+
+        return {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "config": {
+                "host": self.args.host,
+                "users": self.args.users,
+                "chats": chats,
+                "rate_per_user": self.args.rate,
+                "duration_seconds": self.args.duration,
+                "encoding": self.args.encoding,
+            },
+            "messages": {
+                "sent": self.sent,
+                "delivered": delivered,
+                "sent_per_second": self.sent / elapsed if elapsed else 0.0,
+                "delivered_per_second": delivered / elapsed if elapsed else 0.0,
+                "incomplete_broadcasts": len(self.in_flight),
+                "missing_deliveries": sum(flight.pending for flight in self.in_flight.values()),
+            },
+            "failed_users": failed,
+            "metrics": self.stats.summary(elapsed),
         }
-        await websocket.send(json.dumps(message))
-        print("Message sent:", message)
 
-        # Получаем ответ
-        response = await websocket.recv()
-        print("Response received:", response)
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Chat Messenger load test")
+    parser.add_argument("--host", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--chats", default="1", help="comma separated chat ids, users are spread over them round-robin")
+    parser.add_argument("--rate", type=float, default=1.0, help="messages per second per user")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of sending")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for in-flight messages after sending stops")
+    parser.add_argument("--concurrency", type=int, default=50, help="parallel auth requests")
+    parser.add_argument("--auth-retries", type=int, default=20, help="retries per auth call answered with 429")
+    parser.add_argument("--encoding", choices=SUBPROTOCOLS.keys(), default="json")
+    parser.add_argument("--prefix", default="bench_user_", help="login prefix of the virtual users")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--output", default="bench.json")
+
+    args = parser.parse_args()
+    if args.encoding == "msgpack" and msgpack is None:
+        args.encoding = "json"
+
+    return args
+
+
+def print_report(report: dict):
+    messages = report["messages"]
+    print(f"sent {messages['sent']} ({messages['sent_per_second']:.1f}/s), "
+          f"delivered {messages['delivered']} ({messages['delivered_per_second']:.1f}/s), "
+          f"missing {messages['missing_deliveries']}")
+
+    print(f"{'metric':<20}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, metric in sorted(report["metrics"].items()):
+        print(f"{name:<20}{metric['count']:>8}{metric['errors']:>8}"
+              f"{metric.get('p50_ms', 0):>10.2f}{metric.get('p95_ms', 0):>10.2f}{metric.get('p99_ms', 0):>10.2f}")
+
+    for failure in report["failed_users"]:
+        print("user failed:", failure)
+
+
+async def main():
+    args = parse_args()
+    report = await Benchmark(args).run()
+
+    print_report(report)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print("Report written to", args.output)
+
 
 if __name__ == "__main__":
-    asyncio.run(send_message())
\ No newline at end of file
+    asyncio.run(main())
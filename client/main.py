@@ -6,6 +6,7 @@ sys.path.append(os.path.abspath(os.path.dirname(__file__)))
 import flet as ft
 
 from ui.router import router
+from services.cache.core import local_cache
 
 def main(page: ft.Page):
 
@@ -13,6 +14,12 @@ def main(page: ft.Page):
 
     page.on_route_change = router.route_change
     router.page = page
+
+    # No login screen yet, the session comes from the environment
+    router.set_data("token", os.getenv("CHAT_TOKEN"))
+    router.set_data("user_id", os.getenv("CHAT_USER_ID"))
+    if os.getenv("CHAT_USER_ID"):
+        local_cache.use_user(int(os.getenv("CHAT_USER_ID")))
     page.add(
         router.body,
         ft.Text("123")
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from typing import Callable, List, Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    is_pinned INTEGER NOT NULL DEFAULT 0,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    last_read_message_id INTEGER,
+    last_message_id INTEGER,
+    last_activity_at TEXT,
+    last_message TEXT
+);
+CREATE TABLE IF NOT EXISTS member (
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    login TEXT NOT NULL,
+    first_name TEXT,
+    last_name TEXT,
+    avatar TEXT,
+    PRIMARY KEY (chat_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS message (
+    id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_message_chat_id_id ON message (chat_id, id);
+"""
+
+CHAT_COLUMNS = ("id", "name", "is_pinned", "unread_count", "last_read_message_id", "last_message_id", "last_activity_at", "last_message")
+MEMBER_COLUMNS = ("id", "login", "first_name", "last_name", "avatar")
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".chat_messenger")
+DEFAULT_PATH = os.path.join(CACHE_DIR, "cache.sqlite3")
+
+
+def path_for_user(user_id: int) -> str:
+    return os.path.join(CACHE_DIR, f"cache-{int(user_id)}.sqlite3")
+
+
+class LocalCache:
+    """SQLite copy of the chat list, chat members and the newest messages of every chat.
+
+    Lets the client draw its last known state before the network answers.
+    sqlite3 blocks, so every call runs in a worker thread; one connection
+    is shared behind a lock. Only the newest `messages_per_chat` messages
+    of a chat are kept, older ones are fetched from the server on scroll.
+    Every chat user gets a file of their own, see `use_user`.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, messages_per_chat: int = 500):
+        self.path = path
+        self.messages_per_chat = messages_per_chat
+
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    async def _run(self, function: Callable, *args):
+        return await asyncio.to_thread(self._locked, function, *args)
+
+    def _locked(self, function: Callable, *args):
+        with self._lock:
+            if self._connection is None:
+                self._connection = self._open()
+            with self._connection:
+                return function(self._connection, *args)
+
+    def _open(self) -> sqlite3.Connection:
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        return connection
+
+    def use_user(self, user_id: int):
+        """Switches to `user_id`'s own cache file, so one account never sees another's chats."""
+        path = path_for_user(user_id)
+        with self._lock:
+            if path == self.path:
+                return
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            self.path = path
+
+    async def close(self):
+        def close():
+            with self._lock:
+                if self._connection is not None:
+                    self._connection.close()
+                    self._connection = None
+
+        await asyncio.to_thread(close)
+
+    async def clear(self):
+        """Forgets everything, e.g. when another user logs in."""
+        await self._run(lambda connection: connection.executescript("DELETE FROM message; DELETE FROM member; DELETE FROM chat;"))
+
+    # Chats
+
+    async def get_chats(self) -> List[dict]:
+        def get_chats(connection: sqlite3.Connection):
+            rows = connection.execute(
+                f"SELECT {', '.join(CHAT_COLUMNS)} FROM chat "
+                "ORDER BY is_pinned DESC, last_activity_at IS NULL, last_activity_at DESC, id DESC"
+            )
+            return [self._chat_from_row(row) for row in rows]
+
+        return await self._run(get_chats)
+
+    async def save_chats(self, chats: List[dict], replace: bool = True):
+        """Upserts chats as returned by /api/chat/list. With `replace`, chats missing from the list are dropped."""
+        def save_chats(connection: sqlite3.Connection):
+            connection.executemany(
+                f"INSERT OR REPLACE INTO chat ({', '.join(CHAT_COLUMNS)}) VALUES ({', '.join('?' * len(CHAT_COLUMNS))})",
+                [self._chat_to_row(chat) for chat in chats],
+            )
+            if replace:
+                ids = [chat["id"] for chat in chats]
+                connection.execute(f"DELETE FROM chat WHERE id NOT IN ({', '.join('?' * len(ids))})", ids)
+                connection.execute("DELETE FROM member WHERE chat_id NOT IN (SELECT id FROM chat)")
+                connection.execute("DELETE FROM message WHERE chat_id NOT IN (SELECT id FROM chat)")
+
+        await self._run(save_chats)
+
+    @staticmethod
+    def _chat_to_row(chat: dict) -> tuple:
+        last_message = chat.get("last_message")
+        return (
+            chat["id"],
+            chat["name"],
+            int(bool(chat.get("is_pinned"))),
+            chat.get("unread_count", 0),
+            chat.get("last_read_message_id"),
+            last_message["id"] if last_message else None,
+            chat.get("last_activity_at"),
+            json.dumps(last_message) if last_message else None,
+        )
+
+    @staticmethod
+    def _chat_from_row(row: sqlite3.Row) -> dict:
+        chat = dict(row)
+        chat["is_pinned"] = bool(chat["is_pinned"])
+        chat["last_message"] = json.loads(chat["last_message"]) if chat["last_message"] else None
+        return chat
+
+    # Members
+
+    async def get_members(self, chat_id: int) -> List[dict]:
+        def get_members(connection: sqlite3.Connection):
+            rows = connection.execute(
+                "SELECT user_id AS id, login, first_name, last_name, avatar FROM member WHERE chat_id = ? ORDER BY user_id",
+                (chat_id,),
+            )
+            return [dict(row) for row in rows]
+
+        return await self._run(get_members)
+
+    async def save_members(self, chat_id: int, members: List[dict]):
+        def save_members(connection: sqlite3.Connection):
+            connection.execute("DELETE FROM member WHERE chat_id = ?", (chat_id,))
+            connection.executemany(
+                "INSERT INTO member (chat_id, user_id, login, first_name, last_name, avatar) VALUES (?, ?, ?, ?, ?, ?)",
+                [(chat_id, *(member.get(column) for column in MEMBER_COLUMNS)) for member in members],
+            )
+
+        await self._run(save_members)
+
+    # Messages
+
+    async def get_messages(self, chat_id: int, limit: int) -> List[dict]:
+        """Newest `limit` cached messages of a chat, oldest first, in the shape the socket delivers."""
+        def get_messages(connection: sqlite3.Connection):
+            rows = connection.execute(
+                "SELECT data FROM message WHERE chat_id = ? ORDER BY id DESC LIMIT ?",
+                (chat_id, limit),
+            )
+            return [json.loads(row["data"]) for row in rows][::-1]
+
+        return await self._run(get_messages)
+
+    async def last_message_id(self, chat_id: int) -> Optional[int]:
+        def last_message_id(connection: sqlite3.Connection):
+            return connection.execute("SELECT max(id) FROM message WHERE chat_id = ?", (chat_id,)).fetchone()[0]
+
+        return await self._run(last_message_id)
+
+    async def save_messages(self, chat_id: int, messages: List[dict]):
+        """Stores confirmed messages (those with an id) and trims the chat to `messages_per_chat`."""
+        rows = [(message["id"], chat_id, json.dumps(message, default=str)) for message in messages if message.get("id") is not None]
+        if not rows:
+            return
+
+        def save_messages(connection: sqlite3.Connection):
+            connection.executemany("INSERT OR REPLACE INTO message (id, chat_id, data) VALUES (?, ?, ?)", rows)
+            connection.execute(
+                "DELETE FROM message WHERE chat_id = ? AND id < ("
+                "SELECT min(id) FROM (SELECT id FROM message WHERE chat_id = ? ORDER BY id DESC LIMIT ?))",
+                (chat_id, chat_id, self.messages_per_chat),
+            )
+
+        await self._run(save_messages)
+
+
+local_cache = LocalCache()
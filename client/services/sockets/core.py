@@ -1,8 +1,316 @@
+import asyncio
+import json
+import logging
+import random
+import uuid
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set
+from urllib.parse import urlencode
+
+import httpx
 import websockets
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+SUBPROTOCOLS = ["chat.msgpack", "chat.json"] if msgpack else ["chat.json"]
+
+# Delivered ids remembered per chat for deduplication
+RECENT_IDS = 1000
+# Ids are not delivered strictly in order, so a resume starts this many messages back
+RESUME_OVERLAP = 50
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[int, dict], Awaitable[None]]
+
+
+def encode(data, subprotocol: Optional[str]):
+    if subprotocol == "chat.msgpack":
+        return msgpack.packb(data, use_bin_type=True)
+    return json.dumps(data)
+
+
+def decode(frame):
+    # Бинарные фреймы - msgpack, текстовые - JSON
+    if isinstance(frame, bytes):
+        return msgpack.unpackb(frame, raw=False)
+    return json.loads(frame)
+
+
+def from_history(message: dict) -> dict:
+    """Converts a message from the history API to the shape the socket delivers."""
+    data = {
+        "id": message["id"],
+        "chat_id": message["chat_id"],
+        "user_id": message["sender_id"],
+        "data_type": message["data_type"].lower(),
+        "created_at": message["created_at"],
+        "updated_at": message["updated_at"],
+    }
+    if data["data_type"] == "text":
+        data["message"] = message["data"]
+    else:
+        data["file"] = json.loads(message["data"])
+
+    return data
+
+
+class ChatChannel:
+    """Connection state of one chat: the socket, unsent messages and how far the client has seen."""
+
+    def __init__(self, chat_id: int, last_seen_id: Optional[int]):
+        self.chat_id = chat_id
+        self.last_seen_id = last_seen_id # highest id delivered
+
+        self.recent_ids: Deque[int] = deque()
+        self.seen_ids: Set[int] = set()
+
+        self.outbox: Deque[dict] = deque()
+        self.has_outgoing = asyncio.Event()
+        self.connected = asyncio.Event()
+        self.websocket = None
+        self.task: Optional[asyncio.Task] = None
+
+    def remember(self, message_id: int) -> bool:
+        """Records a delivered id. False when it was delivered already."""
+        if message_id in self.seen_ids:
+            return False
+
+        self.seen_ids.add(message_id)
+        self.recent_ids.append(message_id)
+        if len(self.recent_ids) > RECENT_IDS:
+            self.seen_ids.discard(self.recent_ids.popleft())
+
+        if self.last_seen_id is None or message_id > self.last_seen_id:
+            self.last_seen_id = message_id
+        return True
+
+    def resume_after(self) -> Optional[int]:
+        # A lower id may still have been in flight when the socket dropped; the overlap is deduplicated
+        overlap = list(self.recent_ids)[-RESUME_OVERLAP:]
+        return min(overlap) if overlap else self.last_seen_id
+
+
 class ChatSocketClient:
-    def __init__(self):
-        pass
+    """Keeps one websocket per open chat alive across network churn.
+
+    - Reconnects with full-jitter exponential backoff, so clients dropped
+      together do not reconnect together.
+    - After every (re)connect, messages missed while offline are fetched
+      with `GET /chat/{id}/messages?after=<id>`, one page call per 200
+      messages instead of a full history reload. The same happens on a
+      `resync` event, sent when the server had to drop frames for us.
+    - Messages are deduplicated by a set of recently delivered ids, not by
+      comparing with the highest one: ids from different workers or
+      batches can arrive out of order. For the same reason a resume starts
+      `RESUME_OVERLAP` messages back.
+    - Heartbeats are websocket pings; a connection whose pong does not
+      arrive within `ping_timeout` is treated as dead and reconnected.
+    - Outgoing messages wait in an outbox that survives reconnects and
+      are flushed every `batch_interval` seconds, several per frame.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        api_url: str = "http://localhost:8000/api",
+        user_id: int = 0,
+        token: Optional[str] = None,
+        on_message: Optional[MessageHandler] = None,
+        on_event: Optional[MessageHandler] = None,
+        batch_interval: float = 0.02,
+        max_batch: int = 20,
+        ping_interval: float = 20,
+        ping_timeout: float = 20,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30,
+    ):
+        self.url = url
+        self.api_url = api_url
+        self.user_id = user_id
+        self.token = token
+
+        self.on_message = on_message
+        self.on_event = on_event
+
+        self.batch_interval = batch_interval
+        self.max_batch = max_batch
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.channels: Dict[int, ChatChannel] = {}
+        self._http: Optional[httpx.AsyncClient] = None
+
+    async def connect(self, chat_id: int, last_seen_id: Optional[int] = None) -> ChatChannel:
+        """Starts keeping the chat's socket open. `last_seen_id` is the newest message the caller already has."""
+        channel = self.channels.get(chat_id)
+        if channel is None:
+            channel = self.channels[chat_id] = ChatChannel(chat_id, last_seen_id)
+            channel.task = asyncio.create_task(self._run(channel))
+
+        return channel
+
+    async def disconnect(self, chat_id: int):
+        channel = self.channels.pop(chat_id, None)
+        if channel and channel.task:
+            channel.task.cancel()
+            try:
+                await channel.task
+            except asyncio.CancelledError:
+                pass
+
+    async def close(self):
+        for chat_id in list(self.channels):
+            await self.disconnect(chat_id)
+
+        if self._http:
+            await self._http.aclose()
+            self._http = None
+
+    async def send_message(self, chat_id: int, text: str) -> str:
+        """Queues a text message and returns its nonce, echoed back on the delivered copy."""
+        nonce = uuid.uuid4().hex
+        await self.send(chat_id, {"data_type": "text", "message": text, "nonce": nonce})
+
+        return nonce
+
+    async def send(self, chat_id: int, data: dict):
+        channel = await self.connect(chat_id)
+        channel.outbox.append(data)
+        channel.has_outgoing.set()
+
+    async def _run(self, channel: ChatChannel):
+        attempt = 0
+        uri = f"{self.url}?{urlencode({'chat_id': channel.chat_id, 'token': self.token or ''})}"
+
+        while True:
+            try:
+                async with websockets.connect(
+                    uri,
+                    subprotocols=SUBPROTOCOLS,
+                    ping_interval=self.ping_interval,
+                    ping_timeout=self.ping_timeout,
+                ) as websocket:
+                    attempt = 0
+                    channel.websocket = websocket
+                    channel.connected.set()
+
+                    # Frames arriving meanwhile are buffered by websockets and deduplicated by id below
+                    await self._resume(channel)
+
+                    sender = asyncio.create_task(self._send_loop(channel, websocket))
+                    try:
+                        async for frame in websocket:
+                            await self._handle(channel, decode(frame))
+                    finally:
+                        sender.cancel()
+            except asyncio.CancelledError:
+                raise
+            except (OSError, websockets.WebSocketException, httpx.HTTPError):
+                pass
+            except Exception:
+                # A malformed frame or history page must not stop the reconnect loop
+                logger.exception("Chat %s socket failed", channel.chat_id)
+            finally:
+                channel.websocket = None
+                channel.connected.clear()
+
+            attempt += 1
+            await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+
+    async def _send_loop(self, channel: ChatChannel, websocket):
+        while True:
+            await channel.has_outgoing.wait()
+            # Give messages typed in quick succession a moment to join the same frame
+            await asyncio.sleep(self.batch_interval)
+
+            batch = [channel.outbox.popleft() for _ in range(min(len(channel.outbox), self.max_batch))]
+            if not channel.outbox:
+                channel.has_outgoing.clear()
+            if not batch:
+                continue
+
+            try:
+                await websocket.send(encode(batch[0] if len(batch) == 1 else batch, websocket.subprotocol))
+            except BaseException:
+                # Nothing was sent, the next connection sends the batch first
+                channel.outbox.extendleft(reversed(batch))
+                channel.has_outgoing.set()
+                raise
+
+    async def _handle(self, channel: ChatChannel, data: dict):
+        if not isinstance(data, dict):
+            return
+
+        if "event" in data:
+            if data["event"] == "resync":
+                await self._resume(channel)
+            await self._notify(self.on_event, channel, data)
+            return
+
+        if data.get("data_type") in ("text", "file", "image"):
+            await self._deliver(channel, data)
+        else:
+            await self._notify(self.on_event, channel, data)
+
+    async def _deliver(self, channel: ChatChannel, data: dict):
+        message_id = data.get("id")
+        if message_id is not None and not channel.remember(message_id):
+            return
+
+        await self._notify(self.on_message, channel, data)
+
+    async def _notify(self, handler: Optional[MessageHandler], channel: ChatChannel, data: dict):
+        if handler is None:
+            return
+
+        try:
+            await handler(channel.chat_id, data)
+        except Exception:
+            # A failing callback loses this one message, not the connection
+            logger.exception("Chat %s handler failed", channel.chat_id)
+
+    async def _resume(self, channel: ChatChannel):
+        """Fills the gap since the last seen message. A chat opened for the first time starts from now."""
+        after = channel.resume_after()
+        if after is None or not self.token:
+            return
+
+        while True:
+            page = await self.fetch_history(channel.chat_id, after=after)
+            for message in page["messages"]:
+                try:
+                    data = from_history(message)
+                except (KeyError, TypeError, ValueError):
+                    logger.warning("Chat %s: skipping malformed history message %r", channel.chat_id, message.get("id"))
+                    continue
+                await self._deliver(channel, data)
+
+            if not page["has_more_after"] or not page["messages"]:
+                return
+            after = page["messages"][-1]["id"]
+
+    async def fetch_history(self, chat_id: int, before: Optional[int] = None, after: Optional[int] = None, limit: int = 200) -> dict:
+        params = {"limit": limit}
+        if before is not None:
+            params["before"] = before
+        if after is not None:
+            params["after"] = after
+
+        response = await self.http.get(f"/chat/{chat_id}/messages", params=params)
+        response.raise_for_status()
+
+        return response.json()
 
-    async def connect(self):
-        pass
\ No newline at end of file
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+            self._http = httpx.AsyncClient(base_url=self.api_url, headers=headers, timeout=30)
+        return self._http
@@ -1,39 +1,91 @@
+from typing import List
+
 import flet as ft
 
-from services.sockets.core import ChatSocketClient
+from services.cache.core import local_cache
+from services.sockets.core import ChatSocketClient, from_history
+from ui.core import API_URL, WS_URL
+from ui.message_list import MessageList
 
 
-async def ChatView(router):
-    ws_client = ChatSocketClient("ws://localhost:8000/api/chat/ws/chat")
+PAGE_SIZE = 100
 
-    async def send_message(e: ft.ControlEvent):
-        await ws_client.send_message(8, input_field.value)
-        chat_box.controls.append(ft.Text(f"You: {input_field.value}"))
-        e.page.update()
 
-    chat_box = ft.Column()
-    input_field = ft.TextField(label="Message")
-    send_button = ft.ElevatedButton("Send", on_click=send_message)
+def ChatView(router):
+    chat_id = int(router.get_data("chat_id") or 0)
+    user_id = int(router.get_data("user_id") or 0)
+    members = {}
 
-    content = ft.Column(
-        controls = [
-            ft.Box
-        ]
+    ws_client = ChatSocketClient(
+        WS_URL,
+        api_url=API_URL,
+        user_id=user_id,
+        token=router.get_data("token"),
     )
-    
-    return content
 
+    def with_logins(messages: List[dict]) -> List[dict]:
+        for message in messages:
+            member = members.get(message.get("user_id"))
+            if member:
+                message["user_login"] = member["login"]
+        return messages
+
+    async def load_before(before_id: int):
+        page = await ws_client.fetch_history(chat_id, before=before_id, limit=PAGE_SIZE)
+        return with_logins([from_history(message) for message in page["messages"]]), page["has_more_before"]
+
+    async def load_after(after_id: int):
+        page = await ws_client.fetch_history(chat_id, after=after_id, limit=PAGE_SIZE)
+        return with_logins([from_history(message) for message in page["messages"]]), page["has_more_after"]
+
+    async def on_message(message_chat_id: int, message: dict):
+        message_list.add(with_logins([message])[0])
+        await local_cache.save_messages(chat_id, [message])
+
+    async def open_chat():
+        members.update({member["id"]: member for member in await local_cache.get_members(chat_id)})
 
-async def home_page(page: ft.Page):
-    ws_client = ChatSocketClient("ws://localhost:8000/ws/chat")
+        # Cached messages are drawn at once, the socket then fetches only what came after them
+        messages = await local_cache.get_messages(chat_id, PAGE_SIZE)
+        has_more_before = bool(messages)
+        if not messages and ws_client.token:
+            page = await ws_client.fetch_history(chat_id, limit=PAGE_SIZE)
+            messages = [from_history(message) for message in page["messages"]]
+            has_more_before = page["has_more_before"]
+            await local_cache.save_messages(chat_id, messages)
 
-    async def send_message(e):
-        await ws_client.send_message(8, input_field.value)
-        chat_box.controls.append(ft.Text(f"You: {input_field.value}"))
-        page.update()
+        message_list.reset(with_logins(messages), has_more_before)
+        await ws_client.connect(chat_id, message_list.newest_id)
 
-    chat_box = ft.Column()
-    input_field = ft.TextField(label="Message")
+        if ws_client.token:
+            response = await ws_client.http.get(f"/chat/{chat_id}/members")
+            if response.status_code == 200:
+                await local_cache.save_members(chat_id, response.json())
+                members.update({member["id"]: member for member in response.json()})
+
+    async def send_message(e: ft.ControlEvent):
+        text = input_field.value
+        if not text:
+            return
+
+        nonce = await ws_client.send_message(chat_id, text)
+        # Shown right away, confirmed in place once the server echoes the nonce back
+        message_list.add({"data_type": "text", "message": text, "user_id": user_id, "nonce": nonce})
+
+        input_field.value = ""
+        input_field.update()
+
+    ws_client.on_message = on_message
+    message_list = MessageList(user_id, load_before, load_after, on_mount=open_chat, on_unmount=ws_client.close)
+    input_field = ft.TextField(label="Message", expand=True, on_submit=send_message)
     send_button = ft.ElevatedButton("Send", on_click=send_message)
 
-    page.add(chat_box, input_field, send_button)
\ No newline at end of file
+    content = ft.Column(
+        controls = [
+            message_list,
+            ft.Row([input_field, send_button]),
+        ],
+        expand=True,
+    )
+    
+    return content
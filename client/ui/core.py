@@ -0,0 +1,2 @@
+API_URL = "http://localhost:8000/api"
+WS_URL = "ws://localhost:8000/api/chat/ws/chat"
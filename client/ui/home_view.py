@@ -1,7 +1,81 @@
+from typing import Awaitable, Callable, List
+
 import flet as ft
+import httpx
+
+from services.cache.core import local_cache
+from services.sockets.core import from_history
+from ui.core import API_URL
+
+
+# Chats whose cached messages are topped up at startup, so opening them needs no request
+PREFETCH_CHATS = 10
+PREFETCH_LIMIT = 100
+
+
+class ChatList(ft.ListView):
+
+    def __init__(self, on_mount: Callable[[], Awaitable[None]]):
+        super().__init__(expand=True, spacing=2)
+        self.on_mount = on_mount
+
+    def did_mount(self):
+        self.page.run_task(self.on_mount)
+
 
 def HomeView(router):
+
+    def open_chat(chat_id: int):
+        return lambda e: e.page.go(f"/chat?chat_id={chat_id}")
+
+    def render(chats: List[dict]):
+        tiles = []
+        for chat in chats:
+            last_message = chat.get("last_message") or {}
+            tiles.append(ft.ListTile(
+                title=ft.Text(chat["name"]),
+                subtitle=ft.Text(last_message.get("data", ""), max_lines=1, overflow=ft.TextOverflow.ELLIPSIS),
+                trailing=ft.Text(str(chat["unread_count"])) if chat.get("unread_count") else None,
+                on_click=open_chat(chat["id"]),
+            ))
+
+        chat_list.controls = tiles
+        chat_list.update()
+
+    async def load():
+        # Last known state first, before any request is made
+        cached = {chat["id"]: chat for chat in await local_cache.get_chats()}
+        render(list(cached.values()))
+
+        token = router.get_data("token")
+        if not token:
+            return
+
+        async with httpx.AsyncClient(base_url=API_URL, headers={"Authorization": f"Bearer {token}"}, timeout=30) as http:
+            response = await http.get("/chat/list")
+            response.raise_for_status()
+            chats = response.json()
+
+            await local_cache.save_chats(chats)
+            render(chats)
+
+            # Only chats with new messages since the cached copy cost a request, and only from the cached id on
+            changed = [
+                chat for chat in chats
+                if chat.get("last_message") and (cached.get(chat["id"]) or {}).get("last_message_id") != chat["last_message"]["id"]
+            ]
+            for chat in changed[:PREFETCH_CHATS]:
+                since_id = await local_cache.last_message_id(chat["id"])
+                if since_id is None:
+                    continue
+
+                response = await http.get(f"/chat/{chat['id']}/messages", params={"after": since_id, "limit": PREFETCH_LIMIT})
+                if response.status_code != 200:
+                    continue
+
+                await local_cache.save_messages(chat["id"], [from_history(message) for message in response.json()["messages"]])
+
+    chat_list = ChatList(on_mount=load)
+    content = ft.Column([chat_list], expand=True)
     
-    content = ft.Text("Home page")
-    
-    return content
\ No newline at end of file
+    return content
@@ -0,0 +1,227 @@
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import flet as ft
+
+
+# Every row has the same height, so a scroll offset maps to a row without measuring anything
+ROW_HEIGHT = 64
+
+PageLoader = Callable[[int], Awaitable[Tuple[List[dict], bool]]]
+
+
+class MessageRow(ft.Container):
+    """A recycled row: rebinding it to another message only changes its texts."""
+
+    def __init__(self):
+        self.sender = ft.Text(size=12, weight=ft.FontWeight.BOLD, max_lines=1)
+        self.body = ft.Text(max_lines=2, overflow=ft.TextOverflow.ELLIPSIS)
+        super().__init__(
+            content=ft.Column([self.sender, self.body], spacing=2, tight=True),
+            height=ROW_HEIGHT,
+            padding=ft.padding.symmetric(horizontal=8, vertical=4),
+        )
+
+        self.message: Optional[dict] = None
+
+    def bind(self, message: dict, user_id: int):
+        self.message = message
+        self.sender.value = "You" if message.get("user_id") == user_id else str(message.get("user_login") or message.get("user_id"))
+
+        if message.get("data_type") == "text":
+            self.body.value = message.get("message", "")
+        else:
+            self.body.value = f"[{message.get('data_type')}] {(message.get('file') or {}).get('name', '')}"
+
+        # Sent but not confirmed by the server yet
+        self.opacity = 0.6 if message.get("id") is None else 1.0
+
+
+class MessageList(ft.ListView):
+    """Virtualized message list over a bounded slice of a chat's history.
+
+    At most `max_loaded` message dicts are kept in memory and at most
+    `window_size` row controls exist at all. Scrolling near either edge
+    moves the window by recycling rows from one end to the other, so only
+    the rows that changed are sent to the UI. When the window reaches the
+    end of what is loaded, the next page is fetched with `load_before` /
+    `load_after` and the far end of the loaded slice is dropped.
+    """
+
+    def __init__(
+        self,
+        user_id: int,
+        load_before: PageLoader,
+        load_after: PageLoader,
+        on_mount: Optional[Callable[[], Awaitable[None]]] = None,
+        on_unmount: Optional[Callable[[], Awaitable[None]]] = None,
+        window_size: int = 60,
+        max_loaded: int = 1000,
+        shift_step: int = 20,
+    ):
+        super().__init__(expand=True, spacing=0, item_extent=ROW_HEIGHT, on_scroll=self._on_scroll, on_scroll_interval=50)
+
+        self.user_id = user_id
+        self.load_before = load_before
+        self.load_after = load_after
+        self.on_mount = on_mount
+        self.on_unmount = on_unmount
+
+        self.window_size = window_size
+        self.max_loaded = max_loaded
+        self.shift_step = shift_step
+
+        self.messages: List[dict] = []
+        self.start = 0 # index in `messages` of the first row
+        self.has_more_before = False
+        self.has_more_after = False
+        self._loading = False
+
+    def did_mount(self):
+        if self.on_mount:
+            self.page.run_task(self.on_mount)
+
+    def will_unmount(self):
+        if self.on_unmount:
+            self.page.run_task(self.on_unmount)
+
+    @property
+    def newest_id(self) -> Optional[int]:
+        for message in reversed(self.messages):
+            if message.get("id") is not None:
+                return message["id"]
+        return None
+
+    def reset(self, messages: List[dict], has_more_before: bool):
+        """Shows the newest page of a chat, scrolled to the bottom."""
+        self.messages = messages[-self.max_loaded:]
+        self.has_more_before = has_more_before or len(messages) > self.max_loaded
+        self.has_more_after = False
+        self.start = max(len(self.messages) - self.window_size, 0)
+
+        self.controls = []
+        for message in self.messages[self.start:]:
+            row = MessageRow()
+            row.bind(message, self.user_id)
+            self.controls.append(row)
+
+        self.update()
+        self.scroll_to(offset=-1, duration=0)
+
+    def add(self, message: dict):
+        """Appends a live message, or confirms a pending one carrying the same nonce."""
+        nonce = message.get("nonce")
+        if nonce and message.get("id") is not None:
+            for index in range(len(self.messages) - 1, -1, -1):
+                if self.messages[index].get("nonce") == nonce and self.messages[index].get("id") is None:
+                    self.messages[index] = message
+                    self._rebind(index)
+                    return
+
+        if self.has_more_after:
+            # Newer messages were dropped from memory, this one is fetched again when scrolling down
+            return
+
+        at_bottom = self.start + len(self.controls) >= len(self.messages)
+        self.messages.append(message)
+
+        if len(self.controls) < self.window_size:
+            row = MessageRow()
+            row.bind(message, self.user_id)
+            self.controls.append(row)
+            self.update()
+        elif at_bottom:
+            self._shift_down(1)
+
+        if len(self.messages) > self.max_loaded:
+            self._trim_front(len(self.messages) - self.max_loaded)
+
+        if at_bottom:
+            self.scroll_to(offset=-1, duration=150)
+
+    def _rebind(self, index: int):
+        row_index = index - self.start
+        if 0 <= row_index < len(self.controls):
+            row = self.controls[row_index]
+            row.bind(self.messages[index], self.user_id)
+            row.update()
+
+    def _shift_down(self, count: int):
+        """Moves the window `count` messages towards newer ones by moving top rows to the bottom."""
+        count = min(count, len(self.messages) - self.start - len(self.controls))
+        for _ in range(count):
+            row = self.controls.pop(0)
+            row.bind(self.messages[self.start + len(self.controls) + 1], self.user_id)
+            self.controls.append(row)
+            self.start += 1
+
+        if count:
+            self.update()
+        return count
+
+    def _shift_up(self, count: int):
+        count = min(count, self.start)
+        for _ in range(count):
+            self.start -= 1
+            row = self.controls.pop()
+            row.bind(self.messages[self.start], self.user_id)
+            self.controls.insert(0, row)
+
+        if count:
+            self.update()
+        return count
+
+    def _trim_front(self, count: int):
+        count = min(count, self.start)
+        del self.messages[:count]
+        self.start -= count
+        self.has_more_before = self.has_more_before or count > 0
+
+    def _trim_back(self, count: int):
+        keep = max(len(self.messages) - count, self.start + len(self.controls))
+        if keep < len(self.messages):
+            del self.messages[keep:]
+            self.has_more_after = True
+
+    async def _on_scroll(self, e: ft.OnScrollEvent):
+        if self._loading or not self.controls:
+            return
+
+        threshold = ROW_HEIGHT * 5
+        if e.pixels <= e.min_scroll_extent + threshold:
+            await self._scroll_towards_older(e.pixels)
+        elif e.pixels >= e.max_scroll_extent - threshold:
+            await self._scroll_towards_newer(e.pixels)
+
+    async def _scroll_towards_older(self, pixels: float):
+        if self.start == 0 and self.has_more_before:
+            self._loading = True
+            try:
+                older, self.has_more_before = await self.load_before(self.messages[0]["id"])
+            finally:
+                self._loading = False
+
+            self.messages[:0] = older
+            self.start += len(older)
+            if len(self.messages) > self.max_loaded:
+                self._trim_back(len(self.messages) - self.max_loaded)
+
+        shifted = self._shift_up(self.shift_step)
+        if shifted:
+            # Rows were inserted above, keep the same messages under the viewport
+            self.scroll_to(offset=pixels + shifted * ROW_HEIGHT, duration=0)
+
+    async def _scroll_towards_newer(self, pixels: float):
+        if self.start + len(self.controls) >= len(self.messages) and self.has_more_after:
+            self._loading = True
+            try:
+                newer, self.has_more_after = await self.load_after(self.newest_id)
+            finally:
+                self._loading = False
+
+            self.messages.extend(newer)
+            if len(self.messages) > self.max_loaded:
+                self._trim_front(len(self.messages) - self.max_loaded)
+
+        shifted = self._shift_down(self.shift_step)
+        if shifted:
+            self.scroll_to(offset=pixels - shifted * ROW_HEIGHT, duration=0)
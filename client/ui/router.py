@@ -1,9 +1,9 @@
-from utils.router import Router, DataStrategyEnum
+from utils.router import Router
 
 from ui.home_view import HomeView
 from ui.chat_view import ChatView
 
-router = Router(DataStrategyEnum.QUERY)
+router = Router()
 
 router.routes = {
   "/": HomeView,
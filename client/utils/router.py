@@ -8,7 +8,8 @@ class Router:
     def __init__(self):
         self.data = dict()
         self.routes = {}
-        self.body = ft.Container()
+        self.body = ft.Container(expand=True)
+        self.page = None
 
     def set_route(self, endpoint: str, view: Callable):
         self.routes[endpoint] = view
@@ -17,12 +18,11 @@ class Router:
         self.routes.update(route_dictionary)
 
     def route_change(self, route):
-        _page = route.route.split("?")[0]
-        queries = route.route.split("?")[1].split("&") # old [1:]
+        _page, _, query = route.route.partition("?")
+        queries = query.split("&") if query else [] # old [1:]
 
         for item in queries:
-            key = item.split("=")[0]
-            value = item.split("=")[1]
+            key, _, value = item.partition("=")
             self.data[key] = value #.replace('+', ' ')
 
         self.body.content = self.routes[_page](self)
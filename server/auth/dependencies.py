@@ -0,0 +1,60 @@
+import math
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import database
+
+from auth.models import User
+from auth.service import user_auth
+from services.presence.core import presence_tracker
+from services.ratelimit.core import TokenBucketLimiter, auth_ip_limiter, auth_login_limiter
+
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(database.get_session)) -> User:
+    try:
+        login = user_auth.decode_token(token)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid access token")
+
+    user = await user_auth.get_user(login, session)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    presence_tracker.touch(user.id)
+
+    return user
+
+
+async def get_current_user_released(user: User = Depends(get_current_user), session: AsyncSession = Depends(database.get_session)) -> User:
+    """get_current_user for routes that stream: ends the lookup's transaction so no pooled connection is held meanwhile.
+
+    The request session stays usable, the next statement checks a connection out again.
+    """
+    await session.rollback()
+    return user
+
+
+def check_rate_limit(limiter: TokenBucketLimiter, key: str):
+    retry_after = limiter.acquire(key)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+async def limit_auth_by_ip(request: Request):
+    """Per client IP limit for the unauthenticated auth routes. Run uvicorn with --proxy-headers behind a proxy."""
+    check_rate_limit(auth_ip_limiter, request.client.host if request.client else "unknown")
+
+
+def limit_login(login: str):
+    """Per account limit on password attempts, whichever IPs they come from."""
+    check_rate_limit(auth_login_limiter, login)
@@ -0,0 +1,2 @@
+class PasswordHasherBusyError(Exception):
+    """Too many password hashes are queued, the request should be retried later."""
@@ -1,7 +1,7 @@
 import datetime
 from typing import Optional, List
 
-from sqlalchemy import text, String, DateTime
+from sqlalchemy import text, String, DateTime, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from models import Base, UserChat
@@ -9,14 +9,20 @@ from models import Base, UserChat
 
 class User(Base):
     __tablename__ = "user"
-    __table_args__ = {
-        "extend_existing": True,
-    }
+    __table_args__ = (
+        # Typeahead search: covering byte-order prefix indexes and a trigram index for fuzzy matches
+        Index("ix_user_login_prefix", text('login COLLATE "C"'), postgresql_include=["id", "login", "first_name", "last_name", "phone_num", "avatar"]),
+        Index("ix_user_phone_num_prefix", text('phone_num COLLATE "C"'), postgresql_include=["id", "login", "first_name", "last_name", "phone_num", "avatar"]),
+        Index("ix_user_login_trgm", "login", postgresql_using="gin", postgresql_ops={"login": "gin_trgm_ops"}),
+        {
+            "extend_existing": True,
+        },
+    )
 
     id: Mapped[int] = mapped_column(primary_key = True)
 
     login: Mapped[str] = mapped_column(String(30), unique=True)
-    password: Mapped[str] = mapped_column(String(128)) # SHA-256 hashed password
+    password: Mapped[str] = mapped_column(String(128)) # scrypt$n$r$p$salt$key, legacy rows hold a SHA-256 digest
     first_name: Mapped[Optional[str]] = mapped_column(String(30))
     last_name: Mapped[Optional[str]] = mapped_column(String(30))
     phone_num: Mapped[str] = mapped_column(String(13), unique=True) # +380671111111
@@ -1,214 +1,349 @@
 from typing import Optional
-from jose import jwt, JWTError
+from jose import JWTError
 from datetime import timedelta
 
-from fastapi import APIRouter, Query, HTTPException, Depends, Path
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import APIRouter, Query, HTTPException, Depends, Path, Request
+from fastapi.responses import ORJSONResponse
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import database
-from config import BaseConfig
+from config import settings
 
 from auth.models import User
-from auth.schema import UserReadScheme, UserReadWithChatsScheme, UserCreateScheme, UserUpdateScheme, Token, LoginForm
-from auth.utils import hash_password
-from auth.service import user_auth
+from auth.schema import UserReadScheme, UserReadWithChatsScheme, UserCreateScheme, UserUpdateScheme, UserSearchItemScheme, UserSearchScheme, UserListScheme, Token, LoginForm
+from auth.utils import password_hasher
+from auth.exceptions import PasswordHasherBusyError
+from auth.service import user_auth, user_search
+from auth.dependencies import oauth2_scheme, get_current_user, get_current_user_released, limit_auth_by_ip, limit_login
+from utils.cursor import encode_cursor, decode_cursor
+from services.storage.core import content_store, FileTooLargeError
+from services.images.core import image_pipeline, InvalidImageError
+from sync.service import sync_service
 
+router = APIRouter()
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-router = APIRouter()
+@router.post("/signup", dependencies=[Depends(limit_auth_by_ip)])
+async def create_user(user: UserCreateScheme = None, session: AsyncSession = Depends(database.get_session)) -> Optional[UserReadScheme]:
+    existing_user = await session.execute(
+        select(User).where((User.login == user.login) | (User.phone_num == user.phone_num))
+    )
 
+    if existing_user.scalar():
+        raise HTTPException(status_code=400, detail="User with this login or phone number already exists")
 
-@router.post("/signup")
-async def create_user(user: UserCreateScheme = None) -> Optional[UserReadScheme]:
-    async with database.async_session() as session:
-        existing_user = await session.execute(
-            select(User).where((User.login == user.login) | (User.phone_num == user.phone_num))
-        )
-
-        if existing_user.scalar():
-            raise HTTPException(status_code=400, detail="User with this login or phone number already exists")
-
-        new_user = User(
-            login = user.login,
-            password = hash_password(user.login, user.password),
-            first_name = user.first_name,
-            last_name = user.last_name,
-            phone_num = user.phone_num,
-            avatar = user.avatar or 'avatars/default.png',
-            is_active = False,
-            is_admin = user.is_admin
-        )
-
-        session.add(new_user)
-        try:
-            await session.commit()
-            await session.refresh(new_user, ["chats"])
-        except Exception as e:
-            print(f"LOGGER: ERRROR \n\n{e}\n\n")# LOG the error
-            await session.rollback()
-            raise HTTPException(status_code=400, detail="Error creating user")
+    # Hand the connection back to the pool while scrypt runs or waits for a hasher slot
+    await session.rollback()
+
+    try:
+        password = await password_hasher.hash(user.password)
+    except PasswordHasherBusyError:
+        raise HTTPException(status_code=503, detail="Server is busy, try again later")
+
+    new_user = User(
+        login = user.login,
+        password = password,
+        first_name = user.first_name,
+        last_name = user.last_name,
+        phone_num = user.phone_num,
+        avatar = user.avatar or 'avatars/default.png',
+        is_active = False,
+        is_admin = user.is_admin
+    )
+
+    session.add(new_user)
+    try:
+        await session.commit()
+        await session.refresh(new_user, ["chats"])
+    except Exception as e:
+        print(f"LOGGER: ERRROR \n\n{e}\n\n")# LOG the error
+        await session.rollback()
+        raise HTTPException(status_code=400, detail="Error creating user")
 
-        return UserReadScheme.model_validate(new_user)
+    return UserReadScheme.model_validate(new_user)
     
 
 # TODO
 # 1. Create route sign in
-# 2. Create route for searching by login or phone
-# 3. Create logic for user logger for admins
-# 4. Create remove user from chat
+# 2. Create logic for user logger for admins
+# 3. Create remove user from chat
 
-@router.get("/me")
-async def get_me(token: str = Depends(oauth2_scheme)) -> Optional[UserReadWithChatsScheme]:
+@router.get("/me", response_model=UserReadWithChatsScheme)
+async def get_me(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(database.get_session)):
     try:
         login = user_auth.decode_token(token)
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid access token")
     
-    user = await user_auth.get_user_with_chats(login)
+    user = await user_auth.get_user_row(session, login, with_chats=True)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    return UserReadWithChatsScheme.model_validate(user)
-
-@router.get("/user/{login}")
-async def get_user(login: str = Path(...), token: str = Depends(oauth2_scheme)) -> Optional[UserReadWithChatsScheme]:
+    # Row already has the response shape, skip model validation and encode with orjson directly
+    return ORJSONResponse(user)
+
+@router.get("/search")
+async def search_users(
+    q: str = Query(..., min_length=1, max_length=30),
+    fuzzy: bool = Query(False),
+    limit: int = Query(10, ge=1, le=50),
+    cursor: Optional[str] = Query(None),
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(database.get_session),
+) -> UserSearchScheme:
+    if fuzzy and len(q) < 3:
+        raise HTTPException(status_code=400, detail="Fuzzy search needs at least 3 characters")
+
+    after = None
+    if cursor is not None:
+        # Prefix pages continue after a match_key, fuzzy pages after a (similarity, login) pair
+        try:
+            if fuzzy:
+                similarity, login = decode_cursor(cursor)
+                if type(similarity) not in (int, float) or not isinstance(login, str):
+                    raise ValueError("Malformed fuzzy cursor")
+                after = (float(similarity), login)
+            else:
+                match_key, = decode_cursor(cursor)
+                if not isinstance(match_key, str):
+                    raise ValueError("Malformed prefix cursor")
+                after = (match_key,)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    users = await user_search.search(session, q, limit, fuzzy, after)
+
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        last = users[-1]
+        if fuzzy:
+            next_cursor = encode_cursor(last["similarity"], last["login"])
+        else:
+            next_cursor = encode_cursor(last["match_key"])
+
+    return UserSearchScheme(users=[UserSearchItemScheme.model_validate(found) for found in users], next_cursor=next_cursor)
+
+@router.get("/user/{login}", response_model=UserReadWithChatsScheme)
+async def get_user(login: str = Path(...), token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(database.get_session)):
     try:
         request_login = user_auth.decode_token(token)
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid access token")
     
-    request_user = await user_auth.get_user(request_login)
+    request_user = await user_auth.get_user(request_login, session)
     if not request_user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if request_user.is_admin:
-        user = await user_auth.get_user_with_chats(login)
-    else:
-        user = await user_auth.get_user(login)
+    user = await user_auth.get_user_row(session, login, with_chats=request_user.is_admin)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return ORJSONResponse(user)
+
+@router.get("/users", response_model=UserListScheme)
+async def list_users(
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    admin: User = Depends(get_current_user),
+    session: AsyncSession = Depends(database.get_session),
+):
+    if not admin.is_admin:
+        raise HTTPException(status_code=403, detail="User does not have admin permissions")
+
+    users = await user_auth.get_user_rows(session, cursor, limit + 1)
 
-    return UserReadWithChatsScheme.model_validate(user)
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = users[-1]["id"]
+
+    return ORJSONResponse({"users": users, "next_cursor": next_cursor})
 
 @router.patch("/me/update")
-async def update_me(data: UserUpdateScheme, token: str = Depends(oauth2_scheme)) -> Optional[UserReadScheme]:
+async def update_me(data: UserUpdateScheme, token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(database.get_session)) -> Optional[UserReadScheme]:
     try:
         login = user_auth.decode_token(token)
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid access token")
     
-    user = await user_auth.get_user_with_chats(login)
+    try:
+        user = await user_auth.update_user(session, login, data.model_dump(exclude_unset=True, exclude_none=True))
+        if user:
+            await sync_service.record_profile_change(session, user.id)
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=404, detail="User with this login or phone already exist")
+
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+
+    await user_auth.invalidate(login, user.login)
+
+    return UserReadScheme.model_validate(user)
     
-    async with database.async_session() as session:
-        user = await session.merge(user)
 
-        for key, value in data.model_dump(exclude_unset=True, exclude_none=True).items():
-            setattr(user, key, value)
+@router.post("/me/avatar")
+async def upload_avatar(request: Request, user: User = Depends(get_current_user_released), session: AsyncSession = Depends(database.get_session)) -> Optional[UserReadScheme]:
+    """Raw request body is the image. 32/64/256 px WebP and JPEG variants are rendered once, here.
 
-        await session.commit()
-        await session.refresh(user)
+    No connection is held while the upload streams in and the variants render, the session is only used for the final UPDATE.
+    """
+    async def render(tmp_path: str, digest: str):
+        # Rendered before the upload is stored, so an invalid image leaves nothing behind
+        await image_pipeline.generate_variants(digest, tmp_path)
 
-    return UserReadScheme.model_validate(user)
+    try:
+        digest, _ = await content_store.save(request.stream(), settings.avatar_max_bytes, before_commit=render)
+    except FileTooLargeError:
+        raise HTTPException(status_code=413, detail="Image is too large")
+    except InvalidImageError:
+        raise HTTPException(status_code=400, detail="File is not a supported image")
+
+    updated = await user_auth.update_user(session, user.login, {"avatar": f"avatars/{digest}"})
+    await sync_service.record_profile_change(session, user.id)
+    await session.commit()
+
+    await user_auth.invalidate(user.login)
+
+    return UserReadScheme.model_validate(updated)
     
 
 @router.patch("/user/update/{login}")
-async def update_user(login: str = Path(...), data: UserUpdateScheme = None, token: str = Depends(oauth2_scheme)) -> Optional[UserReadScheme]:
+async def update_user(login: str = Path(...), data: UserUpdateScheme = None, token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(database.get_session)) -> Optional[UserReadScheme]:
     try:
         admin_login = user_auth.decode_token(token)
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid access token")
     
-    admin = await user_auth.get_user(admin_login)
+    admin = await user_auth.get_user(admin_login, session)
     if not admin:
         raise HTTPException(status_code=404, detail="User not found")
     elif not admin.is_admin:
         raise HTTPException(status_code=403, detail="User does not have admin permissions")
     
-    async with database.async_session() as session:
-        user = await user_auth.get_user(login)
-        user = await session.merge(user)
+    try:
+        user = await user_auth.update_user(session, login, data.model_dump(exclude_unset=True, exclude_none=True))
+        if user:
+            await sync_service.record_profile_change(session, user.id)
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=404, detail="User with this login or phone already exist")
 
-        for key, value in data.model_dump(exclude_unset=True, exclude_none=True).items():
-            setattr(user, key, value)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
 
-        try:
-            await session.commit()
-            await session.refresh(user)
-        except IntegrityError:
-            raise HTTPException(status_code=404, detail="User with this login or phone already exist")
+    await user_auth.invalidate(login, user.login)
 
     return UserReadScheme.model_validate(user)
     
 
 @router.delete("/me/delete")
-async def delete_me(token: str = Depends(oauth2_scheme)):
+async def delete_me(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(database.get_session)):
     try:
         login = user_auth.decode_token(token)
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid access token")
     
-    user = await user_auth.get_user_with_chats(login)
-    if not user:
+    if not await user_auth.delete_user(session, login):
         raise HTTPException(status_code=404, detail="User not found")
-    
-    async with database.async_session() as session:
-        user = await session.merge(user)
-        await session.delete(user)
-        await session.commit()
+    await session.commit()
+
+    await user_auth.invalidate(login)
+    await user_auth.purge_user_tokens(login)
 
     return {"message": "User deleted successfully"}
 
 
 @router.delete("/user/delete/{login}")
-async def delete_user(login: str = Path(...), token: str = Depends(oauth2_scheme)):
+async def delete_user(login: str = Path(...), token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(database.get_session)):
     try:
         admin_login = user_auth.decode_token(token)
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid access token")
     
-    admin = await user_auth.get_user(admin_login)
+    admin = await user_auth.get_user(admin_login, session)
     if not admin:
         raise HTTPException(status_code=404, detail="User not found")
     elif not admin.is_admin:
         raise HTTPException(status_code=403, detail="User does not have admin permissions")
     
-    async with database.async_session() as session:
-        user = await user_auth.get_user(login)
-        user = await session.merge(user)
-        
-        await session.delete(user)
-        await session.commit()
+    if not await user_auth.delete_user(session, login):
+        raise HTTPException(status_code=404, detail="User not found")
+    await session.commit()
+
+    await user_auth.invalidate(login)
+    await user_auth.purge_user_tokens(login)
 
     return {"message": "User deleted successfully"}
 
 
 
 # JWT
-@router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: LoginForm) -> Token:
+@router.post("/token", response_model=Token, dependencies=[Depends(limit_auth_by_ip)])
+async def login_for_access_token(form_data: LoginForm, session: AsyncSession = Depends(database.get_session)) -> Token:
+    limit_login(form_data.login)
+
+    # Looked up on its own short-lived session, so no connection is held while the password is verified
     user = await user_auth.get_user(form_data.login)
-    if not user or not user_auth.verify_password(form_data.login, form_data.password, user.password):
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    try:
+        matches, needs_rehash = await user_auth.verify_password(form_data.login, form_data.password, user.password)
+        if matches and needs_rehash:
+            # Upgrade legacy SHA-256 (or outdated scrypt) hashes while we have the plain password
+            password = await password_hasher.hash(form_data.password)
+            await user_auth.update_user(session, form_data.login, {"password": password})
+            await session.commit()
+            await user_auth.invalidate(form_data.login)
+    except PasswordHasherBusyError:
+        raise HTTPException(status_code=503, detail="Server is busy, try again later")
+
+    if not matches:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    access_token = user_auth.create_access_token({"sub": form_data.login}, timedelta(minutes=int(BaseConfig.get("JWT_ACCESS_TOKEN_EXPIRE_MINUTES"))))
+    access_token = user_auth.create_access_token({"sub": form_data.login}, timedelta(minutes=settings.jwt_access_token_expire_minutes))
     refresh_token = user_auth.create_refresh_token(form_data.login)
 
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.post("/token/refresh")
-def refresh_token(refresh_token: str) -> dict:
+async def refresh_token(refresh_token: str) -> dict:
     try:
-        payload = jwt.decode(refresh_token, BaseConfig.get("JWT_SECRET_KEY"), algorithms=[BaseConfig.get("JWT_ALGORITHM")])
-        login = payload.get("sub")
+        login = user_auth.decode_token(refresh_token)
         if login is None:
             raise HTTPException(status_code=401, detail="Invalid refresh token")
 
-        new_access_token = user_auth.create_access_token({"sub": login}, timedelta(minutes=int(BaseConfig.get("JWT_ACCESS_TOKEN_EXPIRE_MINUTES"))))
+        new_access_token = user_auth.create_access_token({"sub": login}, timedelta(minutes=settings.jwt_access_token_expire_minutes))
         return {"access_token": new_access_token}
     except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+@router.post("/logout")
+async def logout(refresh_token: Optional[str] = None, token: str = Depends(oauth2_scheme)) -> dict:
+    """Revokes the bearer access token and, when given, the refresh token of the same user."""
+    try:
+        login = user_auth.decode_token(token)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid access token")
+
+    if refresh_token is not None:
+        try:
+            refresh_login = user_auth.decode_token(refresh_token)
+        except JWTError:
+            # Already unusable, nothing to revoke
+            refresh_login = None
+        if refresh_login is not None and refresh_login != login:
+            raise HTTPException(status_code=403, detail="Refresh token belongs to another user")
+        if refresh_login is not None:
+            await user_auth.revoke_token(refresh_token)
+
+    await user_auth.revoke_token(token)
+
+    return {"message": "Logged out successfully"}
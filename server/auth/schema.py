@@ -65,4 +65,29 @@ class Token(BaseModel):
 
 class LoginForm(BaseModel):
     login: str
-    password: str
\ No newline at end of file
+    password: str
+
+
+class UserSearchItemScheme(BaseModel):
+
+    id: int
+    login: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    phone_num: str
+    avatar: str
+
+    class Config:
+        from_attributes = True
+
+
+class UserSearchScheme(BaseModel):
+
+    users: List[UserSearchItemScheme] = []
+    next_cursor: Optional[str] = None
+
+
+class UserListScheme(BaseModel):
+
+    users: List[UserReadScheme] = []
+    next_cursor: Optional[int] = None
\ No newline at end of file
@@ -1,55 +1,294 @@
-from jose import jwt
+import json
+import time
+import hashlib
+from jose import jwt, JWTError
 from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Optional, Tuple
 
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, update, delete, bindparam, func, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import database
-from config import BaseConfig
+from config import settings
 
+from models import UserChat
 from auth.models import User
-from auth.utils import hash_password
+from text_chat.models import Chat
+from auth.utils import password_hasher
+from utils.cache import TTLCache
+
+
+# Hot lookups built once, so each call only binds parameters and hits the compiled cache
+USER_BY_LOGIN = select(User).where(User.login == bindparam("login"))
+
+# Read endpoints project exactly the UserReadScheme columns instead of loading entities
+USER_READ_COLUMNS = (
+    User.id, User.login, User.first_name, User.last_name, User.phone_num, User.avatar,
+    User.is_active, User.is_admin, User.is_blocked, User.last_active, User.created_at, User.updated_at,
+)
+USER_ROW_BY_LOGIN = select(*USER_READ_COLUMNS).where(User.login == bindparam("login"))
+USER_CHAT_ROWS = (
+    select(Chat.id, Chat.name)
+    .join(UserChat, UserChat.chat_id == Chat.id)
+    .where(UserChat.user_id == bindparam("user_id"))
+)
+USER_ROWS_PAGE = select(*USER_READ_COLUMNS).where(User.id > bindparam("cursor")).order_by(User.id).limit(bindparam("limit"))
 
 
 class UserAuth:
 
+    def __init__(self):
+        # Detached User rows keyed by ("user", login), plain dicts keyed by ("row" | "row_with_chats", login)
+        self.cache = TTLCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl_seconds)
+        self.invalidation_hook: Optional[Callable[[str], Awaitable[None]]] = None
+
+        # Verified claims keyed by token digest, each entry expires at the token's own `exp`
+        max_token_lifetime = settings.jwt_refresh_token_expire_days * 86400
+        self.token_cache = TTLCache(maxsize=settings.token_cache_size, ttl=max_token_lifetime)
+        # Revocations must outlive the tokens they reject, so they are never evicted early
+        self.revoked_tokens = TTLCache(maxsize=None, ttl=max_token_lifetime)
+        self.revoked_before = TTLCache(maxsize=None, ttl=max_token_lifetime)
+
+    def set_invalidation_hook(self, hook: Callable[[str], Awaitable[None]]):
+        """Registers a coroutine publishing every invalidation and revocation to the other workers.
+
+        The other workers apply the payload with `apply_invalidation`.
+        """
+        self.invalidation_hook = hook
+
+    async def _publish(self, message: dict):
+        if self.invalidation_hook:
+            await self.invalidation_hook(json.dumps(message))
+
+    def apply_invalidation(self, payload: str):
+        message = json.loads(payload)
+        match message["kind"]:
+            case "user":
+                self.invalidate_local(message["login"])
+            case "token":
+                self._revoke_local(bytes.fromhex(message["digest"]), message["expires_at"])
+            case "purge":
+                self._purge_local(message["login"], message["issued_before"])
+
+    def invalidate_local(self, login: str):
+        for kind in ("user", "row", "row_with_chats"):
+            self.cache.pop((kind, login))
+
+    async def invalidate(self, *logins: str):
+        for login in set(logins):
+            self.invalidate_local(login)
+            await self._publish({"kind": "user", "login": login})
+
     def create_access_token(self, data: dict, expires_delta: timedelta) -> str:
         to_encode = data.copy()
-        expire = datetime.now(timezone.utc) + expires_delta
-        to_encode.update({"exp": expire})
+        now = datetime.now(timezone.utc)
+        to_encode.update({"exp": now + expires_delta, "iat": int(now.timestamp())})
 
-        return jwt.encode(to_encode, BaseConfig.get("JWT_SECRET_KEY"), algorithm=BaseConfig.get("JWT_ALGORITHM"))
+        return jwt.encode(to_encode, settings.jwt_secret_key, algorithm=settings.jwt_algorithm)
 
     def create_refresh_token(self, login: str) -> str:
-        expire = datetime.now(timezone.utc) + timedelta(days=int(BaseConfig.get("JWT_REFRESH_TOKEN_EXPIRE_DAYS")))
-        to_encode = {"sub": login, "exp": expire}
+        now = datetime.now(timezone.utc)
+        expire = now + timedelta(days=settings.jwt_refresh_token_expire_days)
+        to_encode = {"sub": login, "exp": expire, "iat": int(now.timestamp())}
 
-        return jwt.encode(to_encode, BaseConfig.get("JWT_SECRET_KEY"), algorithm=BaseConfig.get("JWT_ALGORITHM"))
+        return jwt.encode(to_encode, settings.jwt_secret_key, algorithm=settings.jwt_algorithm)
     
     def decode_token(self, token: str) -> str:
-        payload = jwt.decode(token, BaseConfig.get("JWT_SECRET_KEY"), algorithms=[BaseConfig.get("JWT_ALGORITHM")])
-        login = payload.get('sub')
+        digest = hashlib.sha256(token.encode('utf-8')).digest()
+
+        claims = self.token_cache.get(digest)
+        if claims is None:
+            payload = jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm])
+            claims = (payload.get('sub'), payload.get('iat', 0))
+
+            ttl = payload.get('exp', 0) - time.time()
+            if ttl > 0:
+                self.token_cache.set(digest, claims, ttl)
+
+        login, issued_at = claims
+
+        if self.revoked_tokens.get(digest) is not None:
+            raise JWTError("Token has been revoked")
+
+        # `iat` has whole seconds, a token issued in the same second as the purge is rejected too
+        revoked_before = self.revoked_before.get(login)
+        if revoked_before is not None and issued_at <= revoked_before:
+            raise JWTError("Token has been revoked")
+
         return login
 
-    def verify_password(self, plain_login: str, plain_password: str, hashed_password: str):
-        return hash_password(plain_login, plain_password) == hashed_password
+    async def revoke_token(self, token: str):
+        """Rejects this token on every worker from now on, until it would have expired anyway."""
+        digest = hashlib.sha256(token.encode('utf-8')).digest()
+
+        try:
+            expires_at = jwt.get_unverified_claims(token).get('exp', 0)
+        except JWTError:
+            return
+
+        self._revoke_local(digest, expires_at)
+        await self._publish({"kind": "token", "digest": digest.hex(), "expires_at": expires_at})
+
+    async def purge_user_tokens(self, login: str):
+        """Rejects every token issued to `login` up to now, on every worker."""
+        issued_before = int(time.time())
+
+        self._purge_local(login, issued_before)
+        await self._publish({"kind": "purge", "login": login, "issued_before": issued_before})
+
+    def _revoke_local(self, digest: bytes, expires_at: float):
+        self.token_cache.pop(digest)
+
+        ttl = expires_at - time.time()
+        if ttl > 0:
+            self.revoked_tokens.expire()
+            self.revoked_tokens.set(digest, True, ttl)
+
+    def _purge_local(self, login: str, issued_before: int):
+        if issued_before > self.revoked_before.get(login, 0):
+            self.revoked_before.expire()
+            self.revoked_before.set(login, issued_before)
+
+    async def verify_password(self, plain_login: str, plain_password: str, hashed_password: str) -> Tuple[bool, bool]:
+        """Returns (matches, needs_rehash), hashing off the event loop."""
+        return await password_hasher.verify(plain_login, plain_password, hashed_password)
+
+    async def get_user(self, login: str, session: Optional[AsyncSession] = None) -> Optional[User]:
+        user = self.cache.get(("user", login))
+        if user is not None:
+            return user
+
+        if session is None:
+            async with database.async_session() as session:
+                return await self.get_user(login, session)
 
-    async def get_user(self, login: str):
-        async with database.async_session() as session:
-            result = await session.execute(
-                select(User).where(User.login == login)
-            )
-            user = result.scalars().first()
+        result = await session.execute(USER_BY_LOGIN, {"login": login})
+        user = result.scalars().first()
+
+        if user is not None:
+            # Cached rows are shared between requests, keep them out of this request's unit of work
+            session.expunge(user)
+            self.cache.set(("user", login), user)
         
         return user
     
-    async def get_user_with_chats(self, login: str) -> User:
-        async with database.async_session() as session:
-            result = await session.execute(
-                select(User).where(User.login == login).options(selectinload(User.chats))
-            )
-            user = result.scalars().first()
-        
-        return user
+    async def get_user_row(self, session: AsyncSession, login: str, with_chats: bool = False) -> Optional[dict]:
+        """UserReadScheme-shaped dict straight from the selected columns, no ORM entity is built."""
+        key = ("row_with_chats" if with_chats else "row", login)
+        row = self.cache.get(key)
+        if row is not None:
+            return row
+
+        result = await session.execute(USER_ROW_BY_LOGIN, {"login": login})
+        found = result.first()
+        if found is None:
+            return None
+
+        row = dict(found._mapping)
+        if with_chats:
+            chats = await session.execute(USER_CHAT_ROWS, {"user_id": row["id"]})
+            row["chats"] = [dict(chat._mapping) for chat in chats]
+        else:
+            row["chats"] = []
+
+        self.cache.set(key, row)
+        return row
+
+    async def get_user_rows(self, session: AsyncSession, cursor: int, limit: int) -> List[dict]:
+        result = await session.execute(USER_ROWS_PAGE, {"cursor": cursor, "limit": limit})
+        return [dict(row._mapping) for row in result]
+
+    async def update_user(self, session: AsyncSession, login: str, values: dict) -> Optional[User]:
+        """Single UPDATE ... RETURNING, no prior SELECT. Returns None when the login does not exist."""
+        if not values:
+            result = await session.execute(USER_BY_LOGIN, {"login": login})
+            return result.scalars().first()
+
+        result = await session.execute(
+            update(User)
+            .where(User.login == login)
+            .values(**values)
+            .returning(User)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        return result.scalars().first()
+
+    async def delete_user(self, session: AsyncSession, login: str) -> bool:
+        """Drops the user's chat memberships and the user itself. Returns False when the login does not exist."""
+        user_id = select(User.id).where(User.login == login).scalar_subquery()
+        await session.execute(delete(UserChat).where(UserChat.user_id == user_id))
+
+        result = await session.execute(
+            delete(User).where(User.login == login).returning(User.id)
+        )
+        return result.scalar() is not None
+
+
+class UserSearch:
+    """Typeahead search over login and phone number.
+
+    Prefix lookups run on the `COLLATE "C"` covering indexes so they are
+    index-only range scans; a digits-only query scans both the phone
+    index (with the leading "+") and the login index. Fuzzy lookups use
+    the pg_trgm GIN index on login. Pages of hot prefixes are kept in a
+    short-lived cache because typeahead repeats the same queries on every
+    keystroke.
+    """
+
+    COLUMNS = (User.id, User.login, User.first_name, User.last_name, User.phone_num, User.avatar)
+
+    def __init__(self):
+        self.cache = TTLCache(maxsize=settings.user_search_cache_size, ttl=settings.user_search_cache_ttl_seconds)
+
+    async def search(self, session: AsyncSession, query: str, limit: int, fuzzy: bool = False, cursor: Optional[tuple] = None) -> List[dict]:
+        """Returns up to `limit + 1` users as dicts so callers can tell whether another page exists."""
+        key = (query, fuzzy, cursor, limit)
+        users = self.cache.get(key)
+        if users is not None:
+            return users
+
+        if fuzzy:
+            statement = self._fuzzy(query, cursor).limit(limit + 1)
+        elif query.startswith("+"):
+            statement = self._prefix(User.phone_num, query, cursor).limit(limit + 1)
+        elif query.isdigit():
+            # Stored numbers carry the "+" and a login may be all digits too, so both prefix scans are merged.
+            # "+" sorts before digits, so phone matches come first and one match_key cursor pages through both
+            matches = union_all(
+                self._prefix(User.phone_num, "+" + query, cursor).limit(limit + 1),
+                self._prefix(User.login, query, cursor).limit(limit + 1),
+            ).subquery()
+            statement = select(matches).order_by(matches.c.match_key.collate("C")).limit(limit + 1)
+        else:
+            statement = self._prefix(User.login, query, cursor).limit(limit + 1)
+
+        result = await session.execute(statement)
+        users = [dict(row._mapping) for row in result.all()]
+
+        self.cache.set(key, users)
+        return users
+
+    def _prefix(self, column, query: str, cursor: Optional[tuple]):
+        """Prefix scan on the column's covering index; `match_key` is the index key, also used as the cursor."""
+        key = column.collate("C")
+
+        # An explicit range rather than LIKE, so the planner always sees bounds it can use on the "C" index.
+        # U+10FFFF is the highest code point, every key starting with the query sorts below query + U+10FFFF
+        statement = select(*self.COLUMNS, key.label("match_key")).where(key >= query, key < query + chr(0x10FFFF))
+        if cursor:
+            statement = statement.where(key > cursor[0])
+
+        return statement.order_by(key)
+
+    def _fuzzy(self, query: str, cursor: Optional[tuple]):
+        similarity = func.similarity(User.login, query)
+
+        statement = select(*self.COLUMNS, similarity.label("similarity")).where(User.login.op("%")(query))
+        if cursor:
+            statement = statement.where(tuple_(similarity, User.login) < tuple_(*cursor))
+
+        return statement.order_by(similarity.desc(), User.login.desc())
+
     
-user_auth = UserAuth()
\ No newline at end of file
+user_auth = UserAuth()
+user_search = UserSearch()
\ No newline at end of file
@@ -1,10 +1,94 @@
-import hashlib
+import asyncio
 import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+from config import settings
+
+from auth.exceptions import PasswordHasherBusyError
 
 
-def hash_password(login: str, password: str) -> str:
+SCRYPT_PREFIX = "scrypt"
+SCRYPT_SALT_BYTES = 16
+SCRYPT_KEY_BYTES = 32
+
+
+def legacy_hash_password(login: str, password: str) -> str:
+    # Unsalted SHA-256 used before scrypt, only kept to verify and upgrade old rows
     login_bytes = login.encode('utf-8')
     password_bytes = password.encode('utf-8')
     data = login_bytes + password_bytes
     hash_bytes = hashlib.sha256(data).digest()
-    return base64.b64encode(hash_bytes).decode('utf-8')
\ No newline at end of file
+    return base64.b64encode(hash_bytes).decode('utf-8')
+
+
+def hash_password(password: str, n: int = None, r: int = None, p: int = None) -> str:
+    """scrypt hash in the form `scrypt$n$r$p$salt$key`. CPU and memory heavy, call through PasswordHasher."""
+    n = n or settings.scrypt_n
+    r = r or settings.scrypt_r
+    p = p or settings.scrypt_p
+
+    salt = os.urandom(SCRYPT_SALT_BYTES)
+    key = hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p, dklen=SCRYPT_KEY_BYTES)
+
+    return "$".join((
+        SCRYPT_PREFIX, str(n), str(r), str(p),
+        base64.b64encode(salt).decode('utf-8'),
+        base64.b64encode(key).decode('utf-8'),
+    ))
+
+
+def verify_password(login: str, password: str, hashed_password: str) -> Tuple[bool, bool]:
+    """Returns (matches, needs_rehash). Legacy SHA-256 and outdated scrypt parameters need a rehash."""
+    if not hashed_password.startswith(SCRYPT_PREFIX + "$"):
+        matches = hmac.compare_digest(legacy_hash_password(login, password), hashed_password)
+        return matches, matches
+
+    _, n, r, p, salt, key = hashed_password.split("$")
+    n, r, p = int(n), int(r), int(p)
+
+    expected = base64.b64decode(key)
+    actual = hashlib.scrypt(password.encode('utf-8'), salt=base64.b64decode(salt), n=n, r=r, p=p, maxmem=256 * n * r * p, dklen=len(expected))
+
+    matches = hmac.compare_digest(actual, expected)
+    outdated = (n, r, p) != (settings.scrypt_n, settings.scrypt_r, settings.scrypt_p)
+    return matches, matches and outdated
+
+
+class PasswordHasher:
+    """Runs password hashing on a bounded thread pool so it never blocks the event loop.
+
+    hashlib.scrypt releases the GIL, so the workers hash in parallel with the loop.
+    At most `max_workers` hashes run at once and at most `max_pending` wait for a
+    worker; anything beyond that is rejected with PasswordHasherBusyError instead
+    of piling up.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hasher")
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, login: str, password: str, hashed_password: str) -> Tuple[bool, bool]:
+        return await self._run(verify_password, login, password, hashed_password)
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_workers + self.max_pending:
+            raise PasswordHasherBusyError()
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+
+password_hasher = PasswordHasher(settings.password_hash_workers, settings.password_hash_max_pending)
@@ -1,7 +1,100 @@
 import os
+from dataclasses import dataclass, fields
+from typing import Optional, get_type_hints
 
+
+@dataclass(frozen=True)
 class BaseConfig:
+    """Typed settings, read from the environment once at import.
+
+    Every field is loaded from the environment variable with the same name
+    in upper case, e.g. `jwt_secret_key` from JWT_SECRET_KEY.
+    """
+
+    pg_user: Optional[str] = None
+    pg_pass: Optional[str] = None
+    pg_host: Optional[str] = None
+    pg_port: Optional[str] = None
+    pg_name: Optional[str] = None
+
+    pg_pool_size: int = 10
+    pg_max_overflow: int = 20
+    pg_pool_timeout: float = 30
+    pg_pool_recycle: int = 1800
+    pg_pool_pre_ping: bool = True
+    pg_statement_cache_size: int = 512 # asyncpg prepared statements per connection, 0 behind pgbouncer
+    pg_command_timeout: float = 30
+    sql_compiled_cache_size: int = 1200
+
+    jwt_secret_key: Optional[str] = None
+    jwt_algorithm: str = "HS256"
+    jwt_access_token_expire_minutes: int = 30
+    jwt_refresh_token_expire_days: int = 7
+    token_cache_size: int = 50000
+
+    scrypt_n: int = 16384 # 16 MiB per hash with r=8
+    scrypt_r: int = 8
+    scrypt_p: int = 1
+    password_hash_workers: int = 2
+    password_hash_max_pending: int = 64
+
+    user_cache_size: int = 10000
+    user_cache_ttl_seconds: float = 30
+    user_search_cache_size: int = 2048
+    user_search_cache_ttl_seconds: float = 10
+
+    ws_send_queue_size: int = 256
+    ws_overflow_policy: str = "drop" # drop | resync
+    ws_backplane: str = "memory" # memory | postgres
+    ws_backplane_health_interval_seconds: float = 5
+
+    ws_user_rate: float = 20 # frames per second per user, 0 disables
+    ws_user_burst: float = 40
+    ws_ip_rate: float = 100
+    ws_ip_burst: float = 200
+    auth_ip_rate_per_minute: float = 30 # /token and /signup
+    auth_ip_burst: float = 10
+    auth_login_rate_per_minute: float = 10 # /token per account
+    auth_login_burst: float = 5
+    ratelimit_shards: int = 16
+    ratelimit_max_keys: int = 100000
+
+    message_batch_size: int = 500
+    message_flush_interval_ms: float = 5
+
+    presence_flush_interval_seconds: float = 15
+    presence_away_after_seconds: float = 300
+
+    sync_page_size: int = 1000
+    sync_retention_hours: float = 72 # Older cursors get a reset
+    sync_compaction_interval_seconds: float = 3600
+    sync_message_overlap_seconds: float = 5 # Covers messages committed after the previous sync started
+
+    storage_root: str = "storage"
+    storage_chunk_size: int = 65536
+    upload_max_bytes: int = 100 * 1024 * 1024
+    avatar_max_bytes: int = 10 * 1024 * 1024
+    image_workers: int = 2
+
+    @classmethod
+    def from_env(cls) -> "BaseConfig":
+        hints = get_type_hints(cls)
+        values = {}
+
+        for field in fields(cls):
+            raw = os.getenv(field.name.upper())
+            if raw is None:
+                continue
+
+            field_type = hints[field.name]
+            if field_type is bool:
+                values[field.name] = raw.lower() in ("1", "true", "yes", "on")
+            elif field_type in (int, float):
+                values[field.name] = field_type(raw)
+            else:
+                values[field.name] = raw
+
+        return cls(**values)
+
 
-    @staticmethod
-    def get(key: str) -> any:
-        return os.getenv(key)
\ No newline at end of file
+settings = BaseConfig.from_env()
@@ -1,8 +1,10 @@
-import os
+from typing import AsyncIterator
 
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 from models import Base
+from config import settings
+from services.metrics.core import InstrumentedAsyncPool, instrument_engine
 
 class DBSingletonMeta(type):
     _instances = {}
@@ -15,11 +17,46 @@ class DBSingletonMeta(type):
 
 class DataBase(metaclass = DBSingletonMeta):
     def __init__(self):
-        url = self._create_url(os.getenv('PG_USER'), os.getenv('PG_PASS'), os.getenv('PG_HOST'), os.getenv('PG_PORT'), os.getenv('PG_NAME'))
+        url = self._create_url(settings.pg_user, settings.pg_pass, settings.pg_host, settings.pg_port, settings.pg_name)
 
-        self.async_engine = create_async_engine(url, future=True)
+        self.async_engine = create_async_engine(
+            url,
+            future=True,
+            poolclass=InstrumentedAsyncPool,
+            pool_size=settings.pg_pool_size,
+            max_overflow=settings.pg_max_overflow,
+            pool_timeout=settings.pg_pool_timeout,
+            pool_recycle=settings.pg_pool_recycle,
+            pool_pre_ping=settings.pg_pool_pre_ping,
+            query_cache_size=settings.sql_compiled_cache_size,
+            connect_args={
+                # SQLAlchemy's asyncpg adapter keeps its own per-connection prepared statement cache
+                "prepared_statement_cache_size": settings.pg_statement_cache_size,
+                "statement_cache_size": settings.pg_statement_cache_size,
+                "command_timeout": settings.pg_command_timeout,
+            },
+        )
+        instrument_engine(self.async_engine.sync_engine)
         self.async_session = async_sessionmaker(bind=self.async_engine, expire_on_commit=False)
 
+    def pool_stats(self) -> dict:
+        pool = self.async_engine.pool
+        capacity = pool.size() + settings.pg_max_overflow
+
+        return {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": settings.pg_max_overflow,
+            "saturation": pool.checkedout() / capacity if capacity else 0.0,
+        }
+
+    async def get_session(self) -> AsyncIterator[AsyncSession]:
+        """FastAPI dependency, one session per request. Connections are checked out lazily on first use."""
+        async with self.async_session() as session:
+            yield session
+
     async def get_query(self, query: str):
         async with self.async_session() as session:
             result = await session.execute(query)
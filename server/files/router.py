@@ -0,0 +1,117 @@
+import asyncio
+import mimetypes
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import Response, StreamingResponse, FileResponse
+
+from config import settings
+from database import database
+from services.storage.core import content_store, FileTooLargeError
+from services.images.core import image_pipeline, VARIANT_SIZES, VARIANT_FORMATS, DEFAULT_AVATAR
+
+from auth.models import User
+from auth.dependencies import get_current_user_released
+from text_chat.service import chat_service
+
+from files.schema import FileRefScheme
+from files.utils import parse_range, content_disposition
+
+
+router = APIRouter()
+
+
+@router.post("/upload")
+async def upload_file(
+    request: Request,
+    name: Optional[str] = Query(None, max_length=255),
+    user: User = Depends(get_current_user_released),
+) -> FileRefScheme:
+    """Raw request body is the file, streamed to disk without being buffered in memory."""
+    try:
+        digest, size = await content_store.save(request.stream(), settings.upload_max_bytes)
+    except FileTooLargeError:
+        raise HTTPException(status_code=413, detail="File is too large")
+
+    content_type = request.headers.get("content-type")
+    if not content_type or content_type == "application/octet-stream":
+        content_type = mimetypes.guess_type(name or "")[0] or "application/octet-stream"
+
+    return FileRefScheme(digest=digest, size=size, name=name, content_type=content_type)
+
+
+@router.get("/avatars/{digest}/{size}.{extension}")
+async def get_avatar(
+    request: Request,
+    # A content digest, or the shared default avatar of users who never uploaded one
+    digest: str = Path(..., pattern=r"^([0-9a-f]{64}|default\.png)$"),
+    size: int = Path(...),
+    extension: str = Path(...),
+):
+    if size not in VARIANT_SIZES or extension not in VARIANT_FORMATS:
+        raise HTTPException(status_code=404, detail="Unknown avatar variant")
+
+    path = image_pipeline.variant_path(digest, size, extension)
+    etag = f'"{digest}-{size}-{extension}"'
+    headers = {
+        "ETag": etag,
+        # Digests name immutable bytes, the default avatar can be swapped on the server
+        "Cache-Control": "public, max-age=86400" if digest == DEFAULT_AVATAR else "public, max-age=31536000, immutable",
+    }
+
+    if request.headers.get("if-none-match") in (etag, "*"):
+        return Response(status_code=304, headers=headers)
+    if not await asyncio.to_thread(os.path.isfile, path):
+        raise HTTPException(status_code=404, detail="Avatar not found")
+
+    return FileResponse(path, media_type=f"image/{extension}", headers=headers)
+
+
+@router.get("/{digest}")
+async def download_file(
+    request: Request,
+    digest: str = Path(..., pattern=r"^[0-9a-f]{64}$"),
+    name: Optional[str] = Query(None, max_length=255),
+    user: User = Depends(get_current_user_released),
+):
+    """Only members of a chat the file was sent to can download it."""
+    async with database.async_session() as session:
+        allowed = await chat_service.can_read_file(session, user.id, digest)
+    # Same answer as a missing file, so digests cannot be probed
+    if not allowed:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    size = await content_store.size(digest)
+    if size is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    headers = {
+        # Content addressed, the bytes behind a digest never change
+        "ETag": f'"{digest}"',
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if name:
+        headers["Content-Disposition"] = content_disposition(name)
+    media_type = mimetypes.guess_type(name or "")[0] or "application/octet-stream"
+
+    if request.headers.get("if-none-match") in (f'"{digest}"', "*"):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", f'"{digest}"') == f'"{digest}"':
+        byte_range = parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(content_store.read(digest, start, end), status_code=206, media_type=media_type, headers=headers)
+
+    if size == 0:
+        return Response(status_code=200, media_type=media_type, headers=headers)
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(content_store.read(digest), media_type=media_type, headers=headers)
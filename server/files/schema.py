@@ -0,0 +1,12 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class FileRefScheme(BaseModel):
+    """What a file message carries over the websocket instead of the file itself."""
+
+    digest: str
+    size: int
+    name: Optional[str] = None
+    content_type: Optional[str] = None
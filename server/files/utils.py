@@ -0,0 +1,43 @@
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parses a single `bytes=start-end` range into inclusive offsets.
+
+    Returns None for ranges that cannot be satisfied, which includes every
+    range of an empty file; multi-range requests are not supported and are
+    treated as unsatisfiable too.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec or size <= 0:
+        return None
+
+    start, _, end = spec.strip().partition("-")
+    try:
+        if start == "":
+            # Suffix range, the last `end` bytes
+            length = int(end)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size - 1
+
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+
+    if start > end or start >= size:
+        return None
+    return start, min(end, size - 1)
+
+
+def content_disposition(name: str) -> str:
+    """`attachment` header for a user supplied file name.
+
+    The name goes out percent-encoded in `filename*` (RFC 5987), with an
+    ASCII-only `filename` fallback stripped of quotes, backslashes and
+    control characters, so it can never break out of the header.
+    """
+    fallback = "".join(char for char in name if " " <= char <= "~" and char not in '"\\') or "download"
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(name, safe='')}"
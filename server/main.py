@@ -3,16 +3,73 @@ import os
 
 sys.path.append(os.path.abspath(os.path.dirname(__file__)))
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 
+from database import database
 from auth.router import router
+from text_chat.router import router as chat_router
+from files.router import router as files_router
+from sync.router import router as sync_router
+from auth.service import user_auth, user_search
+from services.sockets.core import chat_socket_manager
+from services.sockets.backplane import create_backplane
+from services.presence.core import presence_tracker
+from services.images.core import image_pipeline
+from text_chat.service import message_ingest
+from sync.service import sync_service
+from services.metrics.core import registry, MetricsMiddleware, CONTENT_TYPE
+
+
+# Tells the other workers to drop their cached copy of an updated or deleted user and which tokens were revoked
+user_cache_backplane = create_backplane("user_cache_invalidate")
+user_cache_backplane.subscribe(user_auth.apply_invalidation)
+user_auth.set_invalidation_hook(user_cache_backplane.publish)
+
+
+CACHES = {
+    "user": user_auth.cache,
+    "token": user_auth.token_cache,
+    "user_search": user_search.cache,
+}
+
+registry.callback(
+    "db_pool_connections", "Pooled database connections by state",
+    lambda: [((state,), value) for state, value in database.pool_stats().items() if state in ("checked_in", "checked_out", "overflow")],
+    ("state",),
+)
+registry.callback("db_pool_saturation", "Checked out connections over pool_size + max_overflow", lambda: [((), database.pool_stats()["saturation"])])
+registry.callback("cache_hits_total", "Cache hits", lambda: [((name,), cache.hits) for name, cache in CACHES.items()], ("cache",), "counter")
+registry.callback("cache_misses_total", "Cache misses", lambda: [((name,), cache.misses) for name, cache in CACHES.items()], ("cache",), "counter")
+registry.callback("cache_entries", "Entries held per cache", lambda: [((name,), len(cache)) for name, cache in CACHES.items()], ("cache",))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await user_cache_backplane.start()
+    await chat_socket_manager.start()
+    await message_ingest.start()
+    await presence_tracker.start()
+    await sync_service.start()
+    await image_pipeline.start()
+    yield
+    await sync_service.stop()
+    await presence_tracker.stop()
+    await message_ingest.stop()
+    await image_pipeline.stop()
+    await chat_socket_manager.stop()
+    await user_cache_backplane.stop()
 
 
 app = FastAPI(
     title="Chat Messenger API",
     description="API for real-time chat application",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 origins = [
@@ -27,10 +84,22 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Added last so it is the outermost middleware and its timing covers the others too
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(router, prefix="/api/auth", tags=["Auth"])
-#app.include_router(chat.router, prefix="/api", tags=["Chat"])
+app.include_router(chat_router, prefix="/api/chat", tags=["Chat"])
+app.include_router(files_router, prefix="/api/files", tags=["Files"])
+app.include_router(sync_router, prefix="/api/sync", tags=["Sync"])
 
 @app.get("/")
 async def root():
-    return {"message": "Chat server is running!"}
\ No newline at end of file
+    return {"message": "Chat server is running!"}
+
+@app.get("/health")
+async def health():
+    return {"db_pool": database.pool_stats()}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
\ No newline at end of file
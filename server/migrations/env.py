@@ -13,6 +13,7 @@ from alembic import context
 from auth.models import User
 from text_chat.models import Chat, Message
 from models import Base, UserChat
+from sync.models import ChangeLog
 
 from utils.db_url_creator import create_url
 
@@ -0,0 +1,31 @@
+"""message file digest index
+
+Revision ID: 0d8e4c7a2b91
+Revises: b6d3e8f1a2c4
+Create Date: 2026-10-18 21:40:12.518337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0d8e4c7a2b91'
+down_revision: Union[str, None] = 'b6d3e8f1a2c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Downloads are allowed to members of a chat holding a message with the file, looked up by digest
+    op.execute(
+        "CREATE INDEX ix_message_file_digest ON message "
+        "((CASE WHEN message.data_type IN ('FILE', 'IMAGE') THEN message.data::jsonb ->> 'digest' END)) "
+        "WHERE data_type IN ('FILE', 'IMAGE')"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_message_file_digest', table_name='message')
@@ -0,0 +1,26 @@
+"""message chat_id index
+
+Revision ID: 7c2e5d1a9f3b
+Revises: 4bc41d4589ee
+Create Date: 2026-10-18 10:12:41.208315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e5d1a9f3b'
+down_revision: Union[str, None] = '4bc41d4589ee'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_message_chat_id_id', 'message', ['chat_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_message_chat_id_id', table_name='message')
@@ -0,0 +1,30 @@
+"""message search_vector
+
+Revision ID: a3f81c6e4d27
+Revises: 7c2e5d1a9f3b
+Create Date: 2026-10-18 12:04:55.731902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f81c6e4d27'
+down_revision: Union[str, None] = '7c2e5d1a9f3b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Stored generated column, Postgres keeps it current on every insert and update
+    op.add_column('message', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("to_tsvector('simple', data)", persisted=True), nullable=True))
+    op.create_index('ix_message_search_vector', 'message', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_message_search_vector', table_name='message', postgresql_using='gin')
+    op.drop_column('message', 'search_vector')
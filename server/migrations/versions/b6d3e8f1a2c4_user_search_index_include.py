@@ -0,0 +1,35 @@
+"""user search indexes include their own column
+
+Revision ID: b6d3e8f1a2c4
+Revises: f2a9d4e7b1c3
+Create Date: 2026-10-18 19:12:31.407215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d3e8f1a2c4'
+down_revision: Union[str, None] = 'f2a9d4e7b1c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The keys are collated expressions, an index-only scan also needs the bare column it returns
+    op.drop_index('ix_user_phone_num_prefix', table_name='user')
+    op.drop_index('ix_user_login_prefix', table_name='user')
+
+    op.execute('CREATE INDEX ix_user_login_prefix ON "user" (login COLLATE "C") INCLUDE (id, login, first_name, last_name, phone_num, avatar)')
+    op.execute('CREATE INDEX ix_user_phone_num_prefix ON "user" (phone_num COLLATE "C") INCLUDE (id, login, first_name, last_name, phone_num, avatar)')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_phone_num_prefix', table_name='user')
+    op.drop_index('ix_user_login_prefix', table_name='user')
+
+    op.execute('CREATE INDEX ix_user_login_prefix ON "user" (login COLLATE "C") INCLUDE (id, first_name, last_name, phone_num, avatar)')
+    op.execute('CREATE INDEX ix_user_phone_num_prefix ON "user" (phone_num COLLATE "C") INCLUDE (id, login, first_name, last_name, avatar)')
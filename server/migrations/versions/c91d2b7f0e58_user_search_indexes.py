@@ -0,0 +1,34 @@
+"""user search indexes
+
+Revision ID: c91d2b7f0e58
+Revises: a3f81c6e4d27
+Create Date: 2026-10-18 13:37:09.114620
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c91d2b7f0e58'
+down_revision: Union[str, None] = 'a3f81c6e4d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    # Byte-order prefix indexes covering the typeahead columns, so prefix lookups are index-only scans
+    op.execute('CREATE INDEX ix_user_login_prefix ON "user" (login COLLATE "C") INCLUDE (id, first_name, last_name, phone_num, avatar)')
+    op.execute('CREATE INDEX ix_user_phone_num_prefix ON "user" (phone_num COLLATE "C") INCLUDE (id, login, first_name, last_name, avatar)')
+
+    op.execute('CREATE INDEX ix_user_login_trgm ON "user" USING gin (login gin_trgm_ops)')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_login_trgm', table_name='user')
+    op.drop_index('ix_user_phone_num_prefix', table_name='user')
+    op.drop_index('ix_user_login_prefix', table_name='user')
@@ -0,0 +1,37 @@
+"""user_chat read state
+
+Revision ID: d47a0f3b9c12
+Revises: c91d2b7f0e58
+Create Date: 2026-10-18 14:52:30.470183
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd47a0f3b9c12'
+down_revision: Union[str, None] = 'c91d2b7f0e58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user_chat', sa.Column('last_read_message_id', sa.Integer(), nullable=True))
+    op.add_column('user_chat', sa.Column('unread_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill: nothing has been read yet, so every message from someone else is unread
+    op.execute('''
+        UPDATE user_chat uc
+        SET unread_count = (
+            SELECT count(*) FROM message m
+            WHERE m.chat_id = uc.chat_id AND m.sender_id <> uc.user_id
+        )
+    ''')
+
+
+def downgrade() -> None:
+    op.drop_column('user_chat', 'unread_count')
+    op.drop_column('user_chat', 'last_read_message_id')
@@ -0,0 +1,39 @@
+"""chat last message
+
+Revision ID: e5b8c2d6a7f4
+Revises: d47a0f3b9c12
+Create Date: 2026-10-18 15:41:18.902554
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b8c2d6a7f4'
+down_revision: Union[str, None] = 'd47a0f3b9c12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chat', sa.Column('last_message_id', sa.Integer(), nullable=True))
+    op.add_column('chat', sa.Column('last_activity_at', sa.DateTime(), nullable=True))
+
+    op.execute('''
+        UPDATE chat c
+        SET last_message_id = m.id, last_activity_at = m.created_at
+        FROM (
+            SELECT DISTINCT ON (chat_id) chat_id, id, created_at
+            FROM message
+            ORDER BY chat_id, id DESC
+        ) m
+        WHERE m.chat_id = c.id
+    ''')
+
+
+def downgrade() -> None:
+    op.drop_column('chat', 'last_activity_at')
+    op.drop_column('chat', 'last_message_id')
@@ -0,0 +1,76 @@
+"""change log for delta sync
+
+Revision ID: f2a9d4e7b1c3
+Revises: e5b8c2d6a7f4
+Create Date: 2026-10-18 17:05:44.118302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a9d4e7b1c3'
+down_revision: Union[str, None] = 'e5b8c2d6a7f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'change_log',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('tx_id', sa.BigInteger(), server_default=sa.text('(pg_current_xact_id()::text)::bigint'), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('entity', sa.String(length=16), nullable=False),
+        sa.Column('op', sa.String(length=8), nullable=False),
+        sa.Column('chat_id', sa.Integer(), nullable=True),
+        sa.Column('subject_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text("TIMEZONE('utc', now())"), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_change_log_user_id_tx_id_id', 'change_log', ['user_id', 'tx_id', 'id'])
+    op.create_index('ix_change_log_created_at', 'change_log', ['created_at'])
+
+    # Joining or leaving a chat: the user gets the chat itself, every other member the membership change
+    op.execute('''
+        CREATE FUNCTION log_user_chat_change() RETURNS trigger AS $$
+        DECLARE
+            changed user_chat;
+            change_op varchar;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                changed := NEW;
+                change_op := 'upsert';
+            ELSE
+                changed := OLD;
+                change_op := 'delete';
+            END IF;
+
+            INSERT INTO change_log (user_id, entity, op, chat_id, subject_id)
+            VALUES (changed.user_id, 'chat', change_op, changed.chat_id, changed.user_id);
+
+            INSERT INTO change_log (user_id, entity, op, chat_id, subject_id)
+            SELECT uc.user_id, 'member', change_op, changed.chat_id, changed.user_id
+            FROM user_chat uc
+            WHERE uc.chat_id = changed.chat_id AND uc.user_id <> changed.user_id;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    ''')
+    op.execute('''
+        CREATE TRIGGER user_chat_change_log
+        AFTER INSERT OR DELETE ON user_chat
+        FOR EACH ROW EXECUTE FUNCTION log_user_chat_change()
+    ''')
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER user_chat_change_log ON user_chat')
+    op.execute('DROP FUNCTION log_user_chat_change()')
+    op.drop_index('ix_change_log_created_at', table_name='change_log')
+    op.drop_index('ix_change_log_user_id_tx_id_id', table_name='change_log')
+    op.drop_table('change_log')
@@ -1,4 +1,5 @@
 import datetime
+from typing import Optional
 
 from sqlalchemy import ForeignKey, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
@@ -15,4 +16,8 @@ class UserChat(Base):
     chat_id: Mapped[int] = mapped_column(ForeignKey("chat.id"), primary_key=True)
 
     is_pinned: Mapped[bool] = mapped_column(server_default="false")
-    joined_at: Mapped[datetime.datetime] = mapped_column(server_default=text("TIMEZONE('utc', now())"))
\ No newline at end of file
+    joined_at: Mapped[datetime.datetime] = mapped_column(server_default=text("TIMEZONE('utc', now())"))
+
+    # Read state, unread_count is maintained on insert so listing unread chats never counts messages
+    last_read_message_id: Mapped[Optional[int]]
+    unread_count: Mapped[int] = mapped_column(server_default="0")
\ No newline at end of file
@@ -0,0 +1,106 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from config import settings
+from services.storage.core import ContentStore, content_store
+
+
+VARIANT_SIZES = (32, 64, 256)
+VARIANT_FORMATS = {
+    "webp": "WEBP",
+    "jpeg": "JPEG",
+}
+
+# Users who never uploaded an avatar point at "avatars/default.png"
+DEFAULT_AVATAR = "default.png"
+DEFAULT_AVATAR_COLOR = (189, 189, 189)
+
+
+class InvalidImageError(Exception):
+    pass
+
+
+def render_variants(source_path: str, target_path: str, sizes: tuple, formats: dict) -> List[str]:
+    """Writes square thumbnails of `source_path` next to `target_path`. Runs in a worker process."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(source_path) as image:
+            image = ImageOps.exif_transpose(image).convert("RGB")
+
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            written = []
+            for size in sizes:
+                thumbnail = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+
+                for extension, image_format in formats.items():
+                    path = f"{target_path}.{size}.{extension}"
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    thumbnail.save(tmp_path, image_format, quality=85)
+                    os.replace(tmp_path, path)
+                    written.append(path)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImageError(str(e))
+
+    return written
+
+
+def render_default_avatar(path: str, sizes: tuple, formats: dict) -> List[str]:
+    """Draws a plain placeholder at `path` unless an image was put there, then renders its variants. Runs in a worker process."""
+    from PIL import Image
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        Image.new("RGB", (max(sizes), max(sizes)), DEFAULT_AVATAR_COLOR).save(tmp_path, "PNG")
+        os.replace(tmp_path, path)
+
+    return render_variants(path, path, sizes, formats)
+
+
+class ImagePipeline:
+    """Pre-renders fixed-size image variants in a process pool, next to the stored original.
+
+    Resizing happens once per upload, never per request; variants are
+    served as static files with long-lived cache headers.
+    """
+
+    def __init__(self, store: ContentStore, max_workers: int):
+        self.store = store
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def default_avatar_path(self) -> str:
+        return os.path.join(self.store.root, "avatars", DEFAULT_AVATAR)
+
+    def variant_path(self, digest: str, size: int, extension: str) -> str:
+        base = self.default_avatar_path() if digest == DEFAULT_AVATAR else self.store.path_for(digest)
+        return f"{base}.{size}.{extension}"
+
+    async def start(self):
+        """Renders the default avatar's variants, so users without an upload get the same URLs."""
+        try:
+            await self._run(render_default_avatar, self.default_avatar_path(), VARIANT_SIZES, VARIANT_FORMATS)
+        except Exception as e:
+            print(f"LOGGER: ERRROR \n\ndefault avatar not rendered: {e}\n\n")# LOG the error
+
+    async def generate_variants(self, digest: str, source_path: Optional[str] = None) -> List[str]:
+        """Renders the variants of `digest` from its stored original, or from `source_path` before it is stored."""
+        target_path = self.store.path_for(digest)
+        return await self._run(render_variants, source_path or target_path, target_path, VARIANT_SIZES, VARIANT_FORMATS)
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def stop(self):
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown)
+            self._executor = None
+
+
+image_pipeline = ImagePipeline(content_store, settings.image_workers)
@@ -0,0 +1,151 @@
+import asyncio
+import time
+import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update, values, column, Integer, DateTime
+
+from database import database
+from config import settings
+from models import UserChat
+from auth.models import User
+from services.sockets.core import ChatSocketManager, chat_socket_manager
+
+
+class PresenceTracker:
+    """In-memory online/away/offline state with coalesced `last_active` writes.
+
+    Activity only updates dicts; every `flush_interval` seconds the pending
+    timestamps are written with a single multi-row UPDATE, and users idle
+    for `away_after` seconds are moved to away. Status transitions are
+    broadcast to every chat the user belongs to.
+
+    State is per worker: with several workers a user counts as online on
+    each worker that holds one of their sockets.
+    """
+
+    def __init__(self, socket_manager: ChatSocketManager):
+        self.socket_manager = socket_manager
+
+        self.flush_interval = settings.presence_flush_interval_seconds
+        self.away_after = settings.presence_away_after_seconds
+
+        self.connections: Dict[int, int] = {}
+        self.status: Dict[int, str] = {}
+        self.last_seen: Dict[int, float] = {}
+
+        self._pending: Dict[int, datetime.datetime] = {}
+        self._chat_ids: Dict[int, List[int]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await self.flush()
+
+    def touch(self, user_id: int):
+        self._pending[user_id] = datetime.datetime.now(datetime.timezone.utc)
+
+        # Online state is only tracked for users holding a socket on this worker
+        if user_id not in self.connections:
+            return
+
+        self.last_seen[user_id] = time.monotonic()
+        if self.status.get(user_id) == "away":
+            self.status[user_id] = "online"
+            asyncio.create_task(self._broadcast(user_id, "online"))
+
+    async def connected(self, user_id: int):
+        self.connections[user_id] = self.connections.get(user_id, 0) + 1
+        self.touch(user_id)
+
+        if self.status.get(user_id) is None:
+            self.status[user_id] = "online"
+            await self._broadcast(user_id, "online")
+
+    async def disconnected(self, user_id: int):
+        count = self.connections.get(user_id, 0) - 1
+        if count > 0:
+            self.connections[user_id] = count
+            return
+
+        self.connections.pop(user_id, None)
+        self.status.pop(user_id, None)
+        self.last_seen.pop(user_id, None)
+        self._pending[user_id] = datetime.datetime.now(datetime.timezone.utc)
+
+        await self._broadcast(user_id, "offline")
+        self._chat_ids.pop(user_id, None)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+
+            idle_since = time.monotonic() - self.away_after
+            for user_id, seen in list(self.last_seen.items()):
+                if seen < idle_since and self.status.get(user_id) == "online":
+                    self.status[user_id] = "away"
+                    await self._broadcast(user_id, "away")
+
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"LOGGER: ERRROR \n\npresence flush failed: {e}\n\n")# LOG the error
+
+    async def flush(self):
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        rows = values(
+            column("id", Integer),
+            column("last_active", DateTime(timezone=True)),
+            name="pending",
+        ).data(list(pending.items()))
+
+        try:
+            async with database.async_session() as session:
+                await session.execute(
+                    update(User)
+                    .where(User.id == rows.c.id)
+                    # Keep updated_at for real profile changes
+                    .values(last_active=rows.c.last_active, updated_at=User.updated_at)
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+        except BaseException:
+            # Written with the next flush; activity recorded meanwhile is newer and wins
+            for user_id, last_active in pending.items():
+                self._pending.setdefault(user_id, last_active)
+            raise
+
+    async def _broadcast(self, user_id: int, status: str):
+        """Best effort: a failed lookup or publish is logged and never reaches the caller or the flush loop."""
+        try:
+            chat_ids = self._chat_ids.get(user_id)
+            if chat_ids is None:
+                async with database.async_session() as session:
+                    result = await session.execute(select(UserChat.chat_id).where(UserChat.user_id == user_id))
+                chat_ids = self._chat_ids[user_id] = list(result.scalars())
+
+            for chat_id in chat_ids:
+                await self.socket_manager.send_data({
+                    "data_type": "presence",
+                    "chat_id": chat_id,
+                    "user_id": user_id,
+                    "status": status,
+                })
+        except Exception as e:
+            print(f"LOGGER: ERRROR \n\npresence broadcast failed: {e}\n\n")# LOG the error
+
+
+presence_tracker = PresenceTracker(chat_socket_manager)
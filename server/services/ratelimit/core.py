@@ -0,0 +1,78 @@
+import time
+from typing import Dict, Hashable, List, Tuple
+
+from config import settings
+from services.metrics.core import registry
+
+
+RATE_LIMITED = registry.counter("ratelimit_rejected_total", "Requests and frames shed by a rate limiter", ("limiter",))
+
+
+class TokenBucketLimiter:
+    """In-memory token buckets keyed by user id, IP or login.
+
+    Each key may spend `burst` tokens at once, refilled at `rate` tokens per
+    second. Buckets live in `shards` independent dicts: when a shard reaches
+    `max_keys // shards` keys only that shard is swept for idle (full)
+    buckets, so eviction cost stays bounded no matter how many keys there
+    are. A `rate` of 0 disables the limiter.
+
+    State is per worker and, like the caches, meant for the event loop only.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, shards: int, max_keys: int):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+
+        self.max_keys_per_shard = max(max_keys // shards, 1)
+        # key -> (tokens, monotonic time of the last update)
+        self._shards: List[Dict[Hashable, Tuple[float, float]]] = [{} for _ in range(shards)]
+
+    def acquire(self, key: Hashable, cost: float = 1) -> float:
+        """Takes `cost` tokens from the key's bucket. Returns 0 when allowed, else seconds until it would be."""
+        if self.rate <= 0:
+            return 0.0
+
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+
+        bucket = shard.get(key)
+        if bucket is None:
+            if len(shard) >= self.max_keys_per_shard:
+                self._evict(shard, now)
+            tokens = self.burst
+        else:
+            tokens, updated_at = bucket
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+
+        if tokens >= cost:
+            shard[key] = (tokens - cost, now)
+            return 0.0
+
+        shard[key] = (tokens, now)
+        RATE_LIMITED.inc(self.name)
+        return (cost - tokens) / self.rate
+
+    def _evict(self, shard: Dict[Hashable, Tuple[float, float]], now: float):
+        # A bucket that has refilled completely behaves exactly like a missing one
+        idle = [key for key, (tokens, updated_at) in shard.items() if tokens + (now - updated_at) * self.rate >= self.burst]
+        for key in idle:
+            del shard[key]
+
+        # Every key is busy: drop the oldest ones, they have had the longest to refill
+        while len(shard) >= self.max_keys_per_shard:
+            del shard[next(iter(shard))]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+
+def _limiter(name: str, rate: float, burst: float) -> TokenBucketLimiter:
+    return TokenBucketLimiter(name, rate, burst, settings.ratelimit_shards, settings.ratelimit_max_keys)
+
+
+ws_user_limiter = _limiter("ws_user", settings.ws_user_rate, settings.ws_user_burst)
+ws_ip_limiter = _limiter("ws_ip", settings.ws_ip_rate, settings.ws_ip_burst)
+auth_ip_limiter = _limiter("auth_ip", settings.auth_ip_rate_per_minute / 60, settings.auth_ip_burst)
+auth_login_limiter = _limiter("auth_login", settings.auth_login_rate_per_minute / 60, settings.auth_login_burst)
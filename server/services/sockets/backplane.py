@@ -0,0 +1,161 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncConnection
+
+from config import settings
+
+
+# Postgres rejects NOTIFY payloads of 8000 bytes and more
+PG_NOTIFY_MAX_PAYLOAD = 7999
+
+
+class BroadcastBackplane(ABC):
+    """Fans a published payload out to the subscribers of every worker."""
+
+    # Largest payload in bytes `publish` accepts, None when there is no limit
+    max_payload: Optional[int] = None
+
+    def __init__(self):
+        self._handlers: List[Callable[[str], None]] = []
+        self._reconnect_handlers: List[Callable[[], None]] = []
+
+    def subscribe(self, handler: Callable[[str], None], on_reconnect: Optional[Callable[[], None]] = None):
+        """`on_reconnect` runs after the subscription was re-established; payloads published meanwhile are lost."""
+        self._handlers.append(handler)
+        if on_reconnect is not None:
+            self._reconnect_handlers.append(on_reconnect)
+
+    def _dispatch(self, payload: str):
+        for handler in self._handlers:
+            handler(payload)
+
+    def _dispatch_reconnect(self):
+        for handler in self._reconnect_handlers:
+            handler()
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, payload: str):
+        pass
+
+
+class InMemoryBackplane(BroadcastBackplane):
+    """Single-process backplane, delivers straight to local subscribers."""
+
+    async def publish(self, payload: str):
+        self._dispatch(payload)
+
+
+class PostgresBackplane(BroadcastBackplane):
+    """Cross-worker backplane on top of Postgres LISTEN/NOTIFY.
+
+    Holds one pooled connection from the shared engine for LISTEN and
+    publishes with pg_notify() through regular pooled connections. The
+    LISTEN connection is pinged every `health_interval` seconds and
+    replaced when it is closed or does not answer.
+    """
+
+    max_payload = PG_NOTIFY_MAX_PAYLOAD
+
+    def __init__(self, engine: AsyncEngine, channel: str, health_interval: float):
+        super().__init__()
+        self.engine = engine
+        self.channel = channel
+        self.health_interval = health_interval
+
+        self._connection: Optional[AsyncConnection] = None
+        self._driver_connection = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self._listen()
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await self._unlisten()
+
+    async def _listen(self):
+        self._connection = await self.engine.connect()
+        raw_connection = await self._connection.get_raw_connection()
+        self._driver_connection = raw_connection.driver_connection
+
+        await self._driver_connection.add_listener(self.channel, self._on_notify)
+
+    async def _unlisten(self, broken: bool = False):
+        driver_connection, self._driver_connection = self._driver_connection, None
+        connection, self._connection = self._connection, None
+
+        if driver_connection is not None and not broken:
+            await driver_connection.remove_listener(self.channel, self._on_notify)
+
+        if connection is not None:
+            if broken:
+                # Keep a dead connection out of the pool
+                await connection.invalidate()
+            else:
+                await connection.close()
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+
+            if self._driver_connection is not None and not self._driver_connection.is_closed():
+                try:
+                    await asyncio.wait_for(self._driver_connection.execute("SELECT 1"), self.health_interval)
+                    continue
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    pass
+
+            try:
+                await self._unlisten(broken=True)
+            except Exception:
+                pass
+
+            try:
+                await self._listen()
+            except Exception as e:
+                print(f"LOGGER: ERRROR \n\nbackplane {self.channel} reconnect failed: {e}\n\n")# LOG the error
+                continue
+
+            self._dispatch_reconnect()
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str):
+        self._dispatch(payload)
+
+    async def publish(self, payload: str):
+        if len(payload.encode("utf-8")) > PG_NOTIFY_MAX_PAYLOAD:
+            raise ValueError(f"Backplane payload exceeds {PG_NOTIFY_MAX_PAYLOAD} bytes")
+
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": self.channel, "payload": payload}
+            )
+
+
+def create_backplane(channel: str) -> BroadcastBackplane:
+    match settings.ws_backplane:
+        case "postgres":
+            from database import database
+
+            return PostgresBackplane(database.async_engine, channel, settings.ws_backplane_health_interval_seconds)
+        case _:
+            return InMemoryBackplane()
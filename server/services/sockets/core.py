@@ -1,30 +1,259 @@
-from typing import Dict
+import asyncio
+import json
+import time
+from typing import Dict, Optional, Tuple
 from fastapi import WebSocket
 
+from config import settings
+from services.sockets.backplane import BroadcastBackplane, create_backplane
+from services.sockets.encoding import Frame, FrameEncoding, encode, negotiate
+from services.metrics.core import registry
+
+
+WS_BROADCAST_LATENCY = registry.histogram("ws_broadcast_latency_seconds", "Time from a broadcast reaching this worker until it is written to a socket")
+WS_PUBLISH_DURATION = registry.histogram("ws_publish_duration_seconds", "Time to publish a broadcast to the backplane")
+WS_FRAMES_DROPPED = registry.counter("ws_frames_dropped_total", "Frames that did not fit a socket's send queue, by overflow policy", ("policy",))
+
+
+class SocketConnection:
+    """One websocket with its own bounded outbound queue and writer task.
+
+    Broadcasts only enqueue; the writer task drains the queue, so a slow
+    socket never holds up delivery to the rest of the chat.
+    """
+
+    def __init__(self, websocket: WebSocket, chat_id: int, user_id: int, encoding: FrameEncoding, queue_size: int, overflow_policy: str):
+        self.websocket = websocket
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.encoding = encoding
+        self.overflow_policy = overflow_policy
+
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+        self.dropped = 0
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, frame: Frame) -> bool:
+        if self.closed:
+            return False
+
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            self._on_overflow()
+            return False
+
+    def _on_overflow(self):
+        self.dropped += 1
+        WS_FRAMES_DROPPED.inc(self.overflow_policy)
+
+        if self.overflow_policy == "resync":
+            # Throw away the backlog and tell the client to refetch history instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(Frame({"event": "resync", "chat_id": self.chat_id}))
+        else:
+            self.close()
+
+    async def _write_loop(self):
+        try:
+            while True:
+                frame = await self.queue.get()
+                payload = frame.encoded(self.encoding)
+
+                if isinstance(payload, bytes):
+                    await self.websocket.send_bytes(payload)
+                else:
+                    await self.websocket.send_text(payload)
+
+                WS_BROADCAST_LATENCY.observe(time.perf_counter() - frame.received_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket is gone, the receive loop will call disconnect()
+            self.closed = True
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        if self._writer:
+            self._writer.cancel()
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=1013) # Try again later
+        except Exception:
+            pass
+
 
 class ChatSocketManager:
-    def __init__(self):
-        self.active_connections: Dict[int, Dict[int, WebSocket]] = {}
+    def __init__(self, backplane: Optional[BroadcastBackplane] = None):
+        self.active_connections: Dict[int, Dict[int, SocketConnection]] = {}
+
+        self.backplane = backplane or create_backplane("chat_broadcast")
+        self.backplane.subscribe(self._on_backplane_message, on_reconnect=self._on_backplane_reconnect)
+
+        self.queue_size = settings.ws_send_queue_size
+        self.overflow_policy = settings.ws_overflow_policy
+
+    async def start(self):
+        await self.backplane.start()
+
+    async def stop(self):
+        await self.backplane.stop()
+
+    async def connect(self, websocket: WebSocket, chat_id: int, user_id: int) -> SocketConnection:
+        subprotocol, encoding = negotiate(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=subprotocol)
 
-    async def connect(self, websocket: WebSocket, chat_id: int, user_id: int):
-        await websocket.accept()
-        self.active_connections[chat_id] = {user_id: websocket}
+        previous = self.active_connections.get(chat_id, {}).get(user_id)
+        if previous:
+            previous.close()
 
-    def disconnect(self, chat_id: int, user_id: int):
-        self.active_connections[chat_id].pop(user_id, None)
+        connection = SocketConnection(websocket, chat_id, user_id, encoding, self.queue_size, self.overflow_policy)
+        connection.start()
+        self.active_connections.setdefault(chat_id, {})[user_id] = connection
+
+        return connection
+
+    def disconnect(self, chat_id: int, user_id: int, connection: Optional[SocketConnection] = None):
+        chat_connections = self.active_connections.get(chat_id)
+        if chat_connections is None:
+            return
+
+        current = chat_connections.get(user_id)
+        # A reconnect may already have replaced this connection
+        if current is None or (connection is not None and current is not connection):
+            return
+
+        chat_connections.pop(user_id)
+        current.closed = True
+        if current._writer:
+            current._writer.cancel()
+
+        if not chat_connections:
+            self.active_connections.pop(chat_id, None)
 
     async def send_data(self, data: Dict[str, any]):
-        match data["data_type"]:
+        started = time.perf_counter()
+        # Chat id goes in front so workers can skip chats they have no sockets for without parsing
+        payload = f"{data['chat_id']}:{encode(data, FrameEncoding.JSON)}"
+
+        max_payload = self.backplane.max_payload
+        if max_payload is not None and len(payload.encode("utf-8")) > max_payload:
+            if data.get("id") is None:
+                raise ValueError(f"Broadcast of {data.get('data_type')} exceeds {max_payload} bytes")
+            # Too big for the backplane, e.g. a long text over NOTIFY: workers load the stored message instead
+            reference = {"ref": data["id"], "nonce": data.get("nonce")}
+            payload = f"{data['chat_id']}:{encode(reference, FrameEncoding.JSON)}"
+
+        await self.backplane.publish(payload)
+        WS_PUBLISH_DURATION.observe(time.perf_counter() - started)
+
+    def connection_stats(self) -> Dict[int, Tuple[int, int, int]]:
+        """Per chat: open connections, frames queued across them and the deepest single queue."""
+        stats = {}
+        for chat_id, connections in self.active_connections.items():
+            depths = [connection.queue.qsize() for connection in connections.values()]
+            stats[chat_id] = (len(depths), sum(depths), max(depths, default=0))
+        return stats
+
+    def _on_backplane_message(self, payload: str):
+        chat_id, _, body = payload.partition(":")
+        if int(chat_id) not in self.active_connections:
+            return
+
+        data = json.loads(body)
+        if "ref" in data:
+            asyncio.create_task(self._deliver_referenced(int(chat_id), data["ref"], data.get("nonce")))
+            return
+
+        # The published JSON doubles as the frame for JSON clients, so it is never re-encoded
+        self._deliver(Frame(data, json_text=body))
+
+    def _on_backplane_reconnect(self):
+        # Broadcasts sent while the backplane was down are lost, clients refetch what they missed
+        for chat_id, connections in self.active_connections.items():
+            for connection in connections.values():
+                connection.enqueue(Frame({"event": "resync", "chat_id": chat_id}))
+
+    async def _deliver_referenced(self, chat_id: int, message_id: int, nonce: Optional[str]):
+        """Rebuilds a message event published by reference from its stored row."""
+        from database import database
+        from text_chat.models import Message, DataTypeEnum
+
+        try:
+            async with database.async_session() as session:
+                message = await session.get(Message, message_id)
+        except Exception as e:
+            print(f"LOGGER: ERRROR \n\nloading broadcast message {message_id} failed: {e}\n\n")# LOG the error
+            return
+
+        if message is None or message.chat_id != chat_id:
+            return
+
+        data = {
+            "id": message.id,
+            "chat_id": message.chat_id,
+            "user_id": message.sender_id,
+            "data_type": message.data_type.value.lower(),
+            "created_at": message.created_at,
+            "updated_at": message.updated_at,
+        }
+        if message.data_type is DataTypeEnum.TEXT:
+            data["message"] = message.data
+        else:
+            data["file"] = json.loads(message.data)
+        if nonce:
+            data["nonce"] = nonce
+
+        self._deliver(Frame(data))
+
+    def _deliver(self, frame: Frame):
+        match frame.data["data_type"]:
             case "text":
-                await self._send_text(data)
-            case "file":
-                await self._send_file(data)
+                self._send_text(frame)
+            case "file" | "image":
+                self._send_file(frame)
+            case "presence" | "read":
+                self._send_event(frame)
             case _:
                 return None
 
-    async def _send_text(self, data: Dict[str, any]):
-        for connection in self.active_connections[data["chat_id"]].values():
-            await connection.send_json(data)
+    def _send_event(self, frame: Frame):
+        for connection in self.active_connections.get(frame.data["chat_id"], {}).values():
+            connection.enqueue(frame)
+
+    def _send_text(self, frame: Frame):
+        self._send_event(frame)
+
+    def _send_file(self, frame: Frame):
+        # Only the stored file's reference travels over the socket, clients download it separately
+        self._send_event(frame)
+
+
+chat_socket_manager = ChatSocketManager()
+
 
-    async def _send_file(self, chat_id: int, user_id: int, message: str):
-        pass
\ No newline at end of file
+registry.callback(
+    "ws_connections", "Open websocket connections per chat",
+    lambda: ((str(chat_id), count) for chat_id, (count, _, _) in chat_socket_manager.connection_stats().items()),
+    ("chat_id",),
+)
+registry.callback(
+    "ws_send_queue_depth", "Frames waiting in send queues per chat",
+    lambda: ((str(chat_id), depth) for chat_id, (_, depth, _) in chat_socket_manager.connection_stats().items()),
+    ("chat_id",),
+)
+registry.callback(
+    "ws_send_queue_depth_max", "Deepest single send queue",
+    lambda: [((), max((deepest for _, _, deepest in chat_socket_manager.connection_stats().values()), default=0))],
+)
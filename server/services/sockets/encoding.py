@@ -0,0 +1,79 @@
+import json
+import time
+import datetime
+from enum import Enum
+from typing import Dict, List, Optional, Union
+
+try:
+    import msgpack
+except ImportError: # msgpack is optional, clients then fall back to JSON
+    msgpack = None
+
+
+class FrameEncoding(Enum):
+    JSON = "json"
+    MSGPACK = "msgpack"
+
+
+# Websocket subprotocol names offered by clients, in server preference order
+SUBPROTOCOLS = {
+    "chat.msgpack": FrameEncoding.MSGPACK,
+    "chat.json": FrameEncoding.JSON,
+}
+
+
+def _default(value: any) -> any:
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode(data: Dict[str, any], encoding: FrameEncoding) -> Union[str, bytes]:
+    match encoding:
+        case FrameEncoding.MSGPACK:
+            return msgpack.packb(data, default=_default, use_bin_type=True)
+        case _:
+            return json.dumps(data, default=_default)
+
+
+def decode(message: Dict[str, any]) -> any:
+    """Decodes an ASGI websocket.receive message: text frames are JSON, binary frames are msgpack."""
+    if message.get("text") is not None:
+        return json.loads(message["text"])
+
+    if msgpack is None:
+        raise ValueError("Binary frames are not supported by this server")
+    return msgpack.unpackb(message["bytes"], raw=False)
+
+
+def negotiate(offered: List[str]) -> tuple[Optional[str], FrameEncoding]:
+    """Picks the subprotocol to accept from the ones the client offered."""
+    for subprotocol, encoding in SUBPROTOCOLS.items():
+        if subprotocol not in offered:
+            continue
+        if encoding is FrameEncoding.MSGPACK and msgpack is None:
+            continue
+        return subprotocol, encoding
+
+    return None, FrameEncoding.JSON
+
+
+class Frame:
+    """An outgoing event encoded at most once per encoding, shared by all recipients."""
+
+    __slots__ = ("data", "received_at", "_encoded")
+
+    def __init__(self, data: Dict[str, any], json_text: Optional[str] = None):
+        self.data = data
+        # perf_counter() when this worker got the event, for broadcast latency
+        self.received_at = time.perf_counter()
+        self._encoded: Dict[FrameEncoding, Union[str, bytes]] = {}
+
+        if json_text is not None:
+            self._encoded[FrameEncoding.JSON] = json_text
+
+    def encoded(self, encoding: FrameEncoding) -> Union[str, bytes]:
+        payload = self._encoded.get(encoding)
+        if payload is None:
+            payload = self._encoded[encoding] = encode(self.data, encoding)
+        return payload
@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple
+
+from config import settings
+
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class FileTooLargeError(Exception):
+    pass
+
+
+class ContentStore:
+    """Content-addressed file storage on local disk.
+
+    Files live at `<root>/<ab>/<cd>/<sha256>`, so identical uploads map to
+    the same path and are stored once. Uploads are streamed to a temporary
+    file chunk by chunk and renamed into place once their hash is known;
+    all disk I/O runs in worker threads, off the event loop.
+    """
+
+    def __init__(self, root: str, chunk_size: int):
+        self.root = root
+        self.chunk_size = chunk_size
+
+    def path_for(self, digest: str) -> str:
+        if not DIGEST_PATTERN.match(digest):
+            raise ValueError("Invalid digest")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    async def size(self, digest: str) -> Optional[int]:
+        """Size in bytes, or None when nothing is stored under `digest`."""
+        try:
+            stat = await asyncio.to_thread(os.stat, self.path_for(digest))
+        except (FileNotFoundError, ValueError):
+            return None
+        return stat.st_size
+
+    async def save(
+        self,
+        chunks: AsyncIterator[bytes],
+        max_size: int,
+        before_commit: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    ) -> Tuple[str, int]:
+        """Streams `chunks` to disk and returns (sha256 digest, size).
+
+        `before_commit(tmp_path, digest)` runs once the upload is complete; if it
+        raises, the upload is discarded and never reaches the store.
+        """
+        tmp_dir = os.path.join(self.root, "tmp")
+        await asyncio.to_thread(os.makedirs, tmp_dir, exist_ok=True)
+
+        fd, tmp_path = await asyncio.to_thread(tempfile.mkstemp, dir=tmp_dir)
+        hasher = hashlib.sha256()
+        size = 0
+
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FileTooLargeError()
+
+                    hasher.update(chunk)
+                    await asyncio.to_thread(tmp_file.write, chunk)
+
+            digest = hasher.hexdigest()
+            if before_commit is not None:
+                await before_commit(tmp_path, digest)
+            await asyncio.to_thread(self._commit, tmp_path, self.path_for(digest))
+        except BaseException:
+            await asyncio.to_thread(self._discard, tmp_path)
+            raise
+
+        return digest, size
+
+    @staticmethod
+    def _commit(tmp_path: str, path: str):
+        if os.path.exists(path):
+            # Already stored, the new copy is a duplicate
+            os.remove(tmp_path)
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _discard(tmp_path: str):
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    async def read(self, digest: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yields the bytes from `start` to `end` inclusive in chunks of `chunk_size`."""
+        path = self.path_for(digest)
+        file = await asyncio.to_thread(open, path, "rb")
+
+        try:
+            await asyncio.to_thread(file.seek, start)
+            remaining = None if end is None else end - start + 1
+
+            while remaining is None or remaining > 0:
+                size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+                chunk = await asyncio.to_thread(file.read, size)
+                if not chunk:
+                    break
+
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(file.close)
+
+
+content_store = ContentStore(settings.storage_root, settings.storage_chunk_size)
@@ -0,0 +1,35 @@
+import datetime
+from typing import Optional
+
+from sqlalchemy import BigInteger, Index, String, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from models import Base
+
+
+class ChangeLog(Base):
+    """One change a user has to learn about on their next sync.
+
+    Rows are written per recipient: by triggers on user_chat for chat and
+    membership changes, by the app for profile updates. `tx_id` is the
+    writing transaction's id; sync pages by (tx_id, id) and only reads
+    transactions older than every one still running, so a row committed
+    late can never fall behind a cursor. Compacted after
+    `sync_retention_hours`.
+    """
+    __tablename__ = "change_log"
+    __table_args__ = (
+        Index("ix_change_log_user_id_tx_id_id", "user_id", "tx_id", "id"),
+        Index("ix_change_log_created_at", "created_at"), # Compaction
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    tx_id: Mapped[int] = mapped_column(BigInteger, server_default=text("(pg_current_xact_id()::text)::bigint"))
+
+    user_id: Mapped[int] # Recipient, no foreign key so deleting a user never waits on its log
+    entity: Mapped[str] = mapped_column(String(16)) # chat | member | profile
+    op: Mapped[str] = mapped_column(String(8)) # upsert | delete
+    chat_id: Mapped[Optional[int]]
+    subject_id: Mapped[Optional[int]] # User that joined, left or changed their profile
+
+    created_at: Mapped[datetime.datetime] = mapped_column(server_default = text("TIMEZONE('utc', now())"))
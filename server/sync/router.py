@@ -0,0 +1,30 @@
+from typing import Optional
+
+from fastapi import APIRouter, Query, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import database
+
+from auth.models import User
+from auth.dependencies import get_current_user
+
+from sync.schema import SyncScheme
+from sync.service import sync_service
+
+
+router = APIRouter()
+
+
+@router.get("")
+async def sync(
+    cursor: Optional[str] = Query(None),
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(database.get_session),
+) -> SyncScheme:
+    """Everything that changed for the user since `cursor`. Call again right away while `has_more` is set."""
+    try:
+        changes = await sync_service.sync(session, user.id, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return SyncScheme(**changes)
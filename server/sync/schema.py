@@ -0,0 +1,38 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from text_chat.schema import ChatMemberScheme
+
+
+class SyncChatScheme(BaseModel):
+
+    id: int
+    name: str
+    last_message_id: Optional[int] = None
+
+
+class SyncMemberScheme(BaseModel):
+
+    chat_id: int
+    user_id: int
+    op: str # upsert | delete
+
+
+class SyncMessagesScheme(BaseModel):
+
+    chat_id: int
+    last_message_id: Optional[int] = None
+
+
+class SyncScheme(BaseModel):
+
+    cursor: str
+    reset: bool # Cursor is missing or too old, reload /me and /chat/list and keep syncing from `cursor`
+    has_more: bool
+
+    chats: List[SyncChatScheme] = []
+    removed_chat_ids: List[int] = []
+    members: List[SyncMemberScheme] = []
+    profiles: List[ChatMemberScheme] = []
+    messages: List[SyncMessagesScheme] = []
@@ -0,0 +1,196 @@
+import asyncio
+import datetime
+from typing import Optional
+
+from sqlalchemy import select, insert, delete, union, literal, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from database import database
+from config import settings
+from utils.cursor import encode_cursor, decode_cursor
+
+from models import UserChat
+from auth.models import User
+from text_chat.models import Chat
+from sync.models import ChangeLog
+
+
+# Oldest transaction still running plus the server clock, read in the sync's own snapshot
+SYNC_HORIZON = text("SELECT (pg_snapshot_xmin(pg_current_snapshot())::text)::bigint, TIMEZONE('utc', now())")
+
+MAX_ID = 2 ** 63 - 1
+
+COMPACTION_BATCH = 10000
+# Rows outlive the reset threshold by this much, for transactions still open when a cursor was issued
+COMPACTION_GRACE = datetime.timedelta(hours=1)
+
+
+class SyncService:
+    """Delta sync over the change log.
+
+    A cursor is (tx_id, id, synced_at): the last change log position the
+    client has applied and the server time of that sync. Chat and
+    membership changes come from the log; new messages are read from
+    chat.last_activity_at instead, so sending a message never writes to
+    the log. Cursors older than the retention window get `reset` and the
+    client reloads everything once.
+    """
+
+    def __init__(self):
+        self.page_size = settings.sync_page_size
+        self.retention = datetime.timedelta(hours=settings.sync_retention_hours)
+        self.compaction_interval = settings.sync_compaction_interval_seconds
+        self.message_overlap = datetime.timedelta(seconds=settings.sync_message_overlap_seconds)
+
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def record_profile_change(self, session: AsyncSession, user_id: int):
+        """Logs a profile change for the user and everyone sharing a chat with them. Runs in the caller's transaction."""
+        other = aliased(UserChat)
+        recipients = union(
+            select(other.user_id.label("user_id"))
+            .join(UserChat, UserChat.chat_id == other.chat_id)
+            .where(UserChat.user_id == user_id),
+            select(literal(user_id).label("user_id")),
+        ).subquery()
+
+        await session.execute(
+            insert(ChangeLog).from_select(
+                ["user_id", "entity", "op", "subject_id"],
+                select(recipients.c.user_id, literal("profile"), literal("upsert"), literal(user_id)),
+            )
+        )
+
+    async def sync(self, session: AsyncSession, user_id: int, cursor: Optional[str]) -> dict:
+        """Changes for `user_id` since `cursor`. Raises ValueError for a malformed cursor."""
+        horizon, now = (await session.execute(SYNC_HORIZON)).one()
+
+        if cursor is None:
+            return self._reset(horizon, now)
+
+        try:
+            tx_id, last_id, synced_at = decode_cursor(cursor)
+            tx_id, last_id = int(tx_id), int(last_id)
+            synced_at = datetime.datetime.fromisoformat(synced_at)
+            # Cursors carry naive UTC, like the database clock they are compared with
+            if synced_at.tzinfo is not None:
+                raise ValueError("Cursor time must be naive UTC")
+        except (TypeError, ValueError) as e:
+            raise ValueError("Malformed cursor") from e
+
+        if synced_at < now - self.retention:
+            return self._reset(horizon, now)
+
+        result = await session.execute(
+            select(ChangeLog.id, ChangeLog.tx_id, ChangeLog.entity, ChangeLog.op, ChangeLog.chat_id, ChangeLog.subject_id)
+            .where(
+                ChangeLog.user_id == user_id,
+                tuple_(ChangeLog.tx_id, ChangeLog.id) > tuple_(tx_id, last_id),
+                # Later transactions may still commit rows below ids we have already seen
+                ChangeLog.tx_id < horizon,
+            )
+            .order_by(ChangeLog.tx_id, ChangeLog.id)
+            .limit(self.page_size + 1)
+        )
+        changes = result.all()
+
+        has_more = len(changes) > self.page_size
+        changes = changes[:self.page_size]
+        position = (changes[-1].tx_id, changes[-1].id) if has_more else (horizon - 1, MAX_ID)
+
+        # Later changes of the same thing win
+        chats, members, profiles = {}, {}, set()
+        for change in changes:
+            match change.entity:
+                case "chat":
+                    chats[change.chat_id] = change.op
+                case "member":
+                    members[(change.chat_id, change.subject_id)] = change.op
+                case "profile":
+                    profiles.add(change.subject_id)
+
+        removed_chat_ids = [chat_id for chat_id, op in chats.items() if op == "delete"]
+        upserted_chat_ids = [chat_id for chat_id, op in chats.items() if op == "upsert"]
+
+        return {
+            "cursor": encode_cursor(*position, now.isoformat()),
+            "reset": False,
+            "has_more": has_more,
+            "chats": await self._chats(session, upserted_chat_ids),
+            "removed_chat_ids": removed_chat_ids,
+            "members": [{"chat_id": chat_id, "user_id": member_id, "op": op} for (chat_id, member_id), op in members.items()],
+            "profiles": await self._profiles(session, profiles),
+            "messages": await self._messages(session, user_id, synced_at - self.message_overlap),
+        }
+
+    def _reset(self, horizon: int, now: datetime.datetime) -> dict:
+        return {
+            "cursor": encode_cursor(horizon - 1, MAX_ID, now.isoformat()),
+            "reset": True,
+            "has_more": False,
+        }
+
+    async def _chats(self, session: AsyncSession, chat_ids: list) -> list:
+        if not chat_ids:
+            return []
+
+        result = await session.execute(select(Chat.id, Chat.name, Chat.last_message_id).where(Chat.id.in_(chat_ids)))
+        return [dict(row._mapping) for row in result]
+
+    async def _profiles(self, session: AsyncSession, user_ids: set) -> list:
+        if not user_ids:
+            return []
+
+        result = await session.execute(
+            select(User.id, User.login, User.first_name, User.last_name, User.avatar).where(User.id.in_(user_ids))
+        )
+        return [dict(row._mapping) for row in result]
+
+    async def _messages(self, session: AsyncSession, user_id: int, since: datetime.datetime) -> list:
+        """Chats of the user with messages since `since`, with their newest message id."""
+        result = await session.execute(
+            select(Chat.id.label("chat_id"), Chat.last_message_id)
+            .join(UserChat, (UserChat.chat_id == Chat.id) & (UserChat.user_id == user_id))
+            .where(Chat.last_activity_at > since)
+        )
+        return [dict(row._mapping) for row in result]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.compaction_interval)
+
+            try:
+                await self.compact()
+            except Exception as e:
+                print(f"LOGGER: ERRROR \n\nchange log compaction failed: {e}\n\n")# LOG the error
+
+    async def compact(self):
+        """Deletes change log rows past retention, in batches so no single transaction gets long."""
+        cutoff = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - self.retention - COMPACTION_GRACE
+        expired = select(ChangeLog.id).where(ChangeLog.created_at < cutoff).limit(COMPACTION_BATCH)
+
+        while True:
+            async with database.async_session() as session:
+                result = await session.execute(
+                    delete(ChangeLog).where(ChangeLog.id.in_(expired)).execution_options(synchronize_session=False)
+                )
+                await session.commit()
+
+            if result.rowcount < COMPACTION_BATCH:
+                return
+
+
+sync_service = SyncService()
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Server modules import each other from the server directory, as main.py sets up
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# The engine is created at import but only connects on first use, tests never reach a database
+for name, value in {
+    "PG_USER": "test", "PG_PASS": "test", "PG_HOST": "localhost", "PG_PORT": "5432", "PG_NAME": "test",
+    "JWT_SECRET_KEY": "test",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,63 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+from services.images.core import ImagePipeline, InvalidImageError, DEFAULT_AVATAR, VARIANT_SIZES, VARIANT_FORMATS
+from services.storage.core import ContentStore
+
+
+async def chunks(content: bytes):
+    yield content
+
+
+def png() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (300, 200), (255, 0, 0)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pipeline(monkeypatch, tmp_path):
+    image_pipeline = ImagePipeline(ContentStore(str(tmp_path), chunk_size=1024), max_workers=1)
+
+    # Rendering runs inline instead of in a worker process
+    async def run(func, *args):
+        return func(*args)
+
+    monkeypatch.setattr(image_pipeline, "_run", run)
+    return image_pipeline
+
+
+def save_avatar(image_pipeline: ImagePipeline, content: bytes):
+    async def render(tmp_path, digest):
+        await image_pipeline.generate_variants(digest, tmp_path)
+
+    return asyncio.run(image_pipeline.store.save(chunks(content), 1024 * 1024, before_commit=render))
+
+
+def test_avatar_is_stored_with_every_variant(pipeline):
+    digest, _ = save_avatar(pipeline, png())
+
+    assert asyncio.run(pipeline.store.size(digest)) is not None
+    for size in VARIANT_SIZES:
+        for extension in VARIANT_FORMATS:
+            with Image.open(pipeline.variant_path(digest, size, extension)) as variant:
+                assert variant.size == (size, size)
+
+
+def test_invalid_image_leaves_nothing_behind(pipeline, tmp_path):
+    with pytest.raises(InvalidImageError):
+        save_avatar(pipeline, b"not an image")
+
+    assert [path for path in tmp_path.rglob("*") if path.is_file()] == []
+
+
+def test_default_avatar_variants_are_rendered_on_start(pipeline):
+    asyncio.run(pipeline.start())
+
+    for size in VARIANT_SIZES:
+        for extension in VARIANT_FORMATS:
+            with Image.open(pipeline.variant_path(DEFAULT_AVATAR, size, extension)) as variant:
+                assert variant.size == (size, size)
@@ -0,0 +1,27 @@
+import asyncio
+
+from services.sockets.backplane import InMemoryBackplane
+
+
+def test_publish_reaches_every_subscriber_in_order():
+    backplane = InMemoryBackplane()
+    first, second = [], []
+    backplane.subscribe(first.append)
+    backplane.subscribe(second.append)
+
+    async def publish():
+        await backplane.publish("1:a")
+        await backplane.publish("1:b")
+
+    asyncio.run(publish())
+
+    assert first == ["1:a", "1:b"]
+    assert second == ["1:a", "1:b"]
+
+
+def test_publish_without_subscribers_is_a_no_op():
+    asyncio.run(InMemoryBackplane().publish("1:a"))
+
+
+def test_in_memory_backplane_has_no_payload_limit():
+    assert InMemoryBackplane.max_payload is None
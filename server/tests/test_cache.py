@@ -0,0 +1,64 @@
+import pytest
+
+from utils import cache
+from utils.cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entry_expires_after_ttl(clock):
+    ttl_cache = TTLCache(maxsize=10, ttl=5)
+    ttl_cache.set("a", 1)
+
+    clock[0] += 4.9
+    assert ttl_cache.get("a") == 1
+
+    clock[0] += 0.1
+    assert ttl_cache.get("a") is None
+    assert len(ttl_cache) == 0
+
+
+def test_per_entry_ttl_overrides_default(clock):
+    ttl_cache = TTLCache(maxsize=10, ttl=5)
+    ttl_cache.set("a", 1, ttl=60)
+
+    clock[0] += 30
+    assert ttl_cache.get("a") == 1
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    ttl_cache = TTLCache(maxsize=2, ttl=60)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+    ttl_cache.get("a")
+    ttl_cache.set("c", 3)
+
+    assert ttl_cache.get("a") == 1
+    assert ttl_cache.get("b") is None
+    assert ttl_cache.get("c") == 3
+
+
+def test_unbounded_cache_keeps_entries_until_they_expire(clock):
+    ttl_cache = TTLCache(maxsize=None, ttl=60)
+    for key in range(1000):
+        ttl_cache.set(key, True, ttl=10 if key % 2 else 60)
+    assert len(ttl_cache) == 1000
+
+    clock[0] += 10
+    ttl_cache.expire()
+    assert len(ttl_cache) == 500
+    assert ttl_cache.get(0) is True
+
+
+def test_hits_and_misses_are_counted(clock):
+    ttl_cache = TTLCache(maxsize=10, ttl=60)
+    ttl_cache.set("a", 1)
+    ttl_cache.get("a")
+    ttl_cache.get("b")
+
+    assert (ttl_cache.hits, ttl_cache.misses) == (1, 1)
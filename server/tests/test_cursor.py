@@ -0,0 +1,25 @@
+import pytest
+
+from utils.cursor import encode_cursor, decode_cursor
+
+
+@pytest.mark.parametrize("values", [
+    (42,),
+    (0.75, 1234),
+    ("login",),
+    (17, 3, "2026-10-18T12:00:00"),
+])
+def test_round_trip(values):
+    assert decode_cursor(encode_cursor(*values)) == list(values)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor("a/b+c?", 10 ** 12)
+
+    assert all(char.isalnum() or char in "-_=" for char in cursor)
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "", encode_cursor()[:-2] + "!!", "eyJhIjoxfQ=="])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -0,0 +1,86 @@
+import hashlib
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from auth.dependencies import get_current_user_released
+from database import database
+from files import router
+from services.storage.core import content_store
+from text_chat.service import chat_service
+
+
+class NoSession:
+
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+def store(content: bytes) -> str:
+    digest = hashlib.sha256(content).hexdigest()
+    path = content_store.path_for(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(content)
+    return digest
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    readable = set()
+
+    async def can_read_file(session, user_id, digest):
+        return digest in readable
+
+    monkeypatch.setattr(content_store, "root", str(tmp_path))
+    monkeypatch.setattr(chat_service, "can_read_file", can_read_file)
+    monkeypatch.setattr(database, "async_session", NoSession)
+
+    app = FastAPI()
+    app.include_router(router.router)
+    app.dependency_overrides[get_current_user_released] = lambda: type("User", (), {"id": 1})()
+
+    test_client = TestClient(app)
+    test_client.readable = readable
+    return test_client
+
+
+def test_files_outside_the_users_chats_are_not_found(client):
+    digest = store(b"secret")
+
+    assert client.get(f"/{digest}").status_code == 404
+
+    client.readable.add(digest)
+    response = client.get(f"/{digest}")
+    assert response.status_code == 200
+    assert response.content == b"secret"
+
+
+def test_ranges_are_served_partially(client):
+    digest = store(b"0123456789")
+    client.readable.add(digest)
+
+    response = client.get(f"/{digest}", headers={"Range": "bytes=2-4"})
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 2-4/10"
+    assert response.content == b"234"
+
+
+def test_empty_file_is_an_empty_body_and_ranges_of_it_are_unsatisfiable(client):
+    digest = store(b"")
+    client.readable.add(digest)
+
+    response = client.get(f"/{digest}")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == "0"
+    assert response.content == b""
+
+    response = client.get(f"/{digest}", headers={"Range": "bytes=-1"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */0"
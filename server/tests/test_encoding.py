@@ -0,0 +1,55 @@
+import datetime
+import json
+
+import pytest
+
+from services.sockets import encoding
+from services.sockets.encoding import Frame, FrameEncoding, decode, encode, negotiate
+
+
+def test_msgpack_is_preferred_when_offered_and_available():
+    if encoding.msgpack is None:
+        pytest.skip("msgpack is not installed")
+
+    assert negotiate(["chat.json", "chat.msgpack"]) == ("chat.msgpack", FrameEncoding.MSGPACK)
+
+
+def test_falls_back_to_json_without_msgpack(monkeypatch):
+    monkeypatch.setattr(encoding, "msgpack", None)
+
+    assert negotiate(["chat.msgpack", "chat.json"]) == ("chat.json", FrameEncoding.JSON)
+
+
+@pytest.mark.parametrize("offered", [[], ["graphql-ws"]])
+def test_clients_without_a_known_subprotocol_get_plain_json(offered):
+    assert negotiate(offered) == (None, FrameEncoding.JSON)
+
+
+def test_json_frames_round_trip_with_datetimes():
+    sent_at = datetime.datetime(2026, 10, 18, 12, 0)
+    payload = encode({"id": 1, "created_at": sent_at}, FrameEncoding.JSON)
+
+    assert decode({"type": "websocket.receive", "text": payload}) == {"id": 1, "created_at": "2026-10-18T12:00:00"}
+
+
+def test_msgpack_frames_round_trip():
+    if encoding.msgpack is None:
+        pytest.skip("msgpack is not installed")
+
+    payload = encode({"id": 1, "message": "hi"}, FrameEncoding.MSGPACK)
+
+    assert decode({"type": "websocket.receive", "bytes": payload}) == {"id": 1, "message": "hi"}
+
+
+def test_binary_frames_are_rejected_without_msgpack(monkeypatch):
+    monkeypatch.setattr(encoding, "msgpack", None)
+
+    with pytest.raises(ValueError):
+        decode({"type": "websocket.receive", "bytes": b"\x81"})
+
+
+def test_frame_encodes_once_per_encoding_and_reuses_published_json():
+    frame = Frame({"id": 1}, json_text='{"id": 1}')
+
+    assert frame.encoded(FrameEncoding.JSON) == '{"id": 1}'
+    assert json.loads(frame.encoded(FrameEncoding.JSON)) == frame.data
@@ -0,0 +1,45 @@
+import pytest
+
+from files.utils import parse_range, content_disposition
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes= 10-20", (10, 20)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=1000-",
+    "bytes=50-10",
+    "bytes=-0",
+    "bytes=0-10,20-30",
+    "items=0-10",
+    "bytes=a-b",
+])
+def test_unsatisfiable_ranges(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=0-", "bytes=0-0", "bytes=-1"])
+def test_no_range_of_an_empty_file_is_satisfiable(header):
+    assert parse_range(header, 0) is None
+
+
+def test_content_disposition_cannot_break_out_of_the_header():
+    header = content_disposition('evil"\r\nSet-Cookie: a=b.txt')
+
+    assert "\r" not in header and "\n" not in header
+    assert header.startswith('attachment; filename="evilSet-Cookie: a=b.txt"; ')
+
+
+def test_content_disposition_encodes_non_ascii_names():
+    assert content_disposition("звіт.pdf") == (
+        "attachment; filename=\".pdf\"; filename*=UTF-8''%D0%B7%D0%B2%D1%96%D1%82.pdf"
+    )
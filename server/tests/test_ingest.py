@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from text_chat.models import DataTypeEnum
+from text_chat.service import MessageIngest
+
+
+def ingest(inserts: list, fail_on: str = None, max_batch: int = 100) -> MessageIngest:
+    """Ingest whose writes are recorded instead of reaching the database."""
+    message_ingest = MessageIngest()
+    message_ingest.max_batch = max_batch
+    message_ingest.flush_interval = 0.01
+
+    async def insert(rows):
+        inserts.append([row["data"] for row in rows])
+        if any(row["data"] == fail_on for row in rows):
+            raise IntegrityError("INSERT INTO message", {}, Exception("foreign key violation"))
+        return [SimpleNamespace(id=row["data"], created_at=None) for row in rows]
+
+    message_ingest._insert = insert
+    return message_ingest
+
+
+def test_messages_are_written_in_one_batch_in_submit_order():
+    inserts = []
+
+    async def run():
+        message_ingest = ingest(inserts)
+        await message_ingest.start()
+        results = await asyncio.gather(*(message_ingest.submit(1, 2, data, DataTypeEnum.TEXT) for data in "abc"))
+        await message_ingest.stop()
+        return results
+
+    results = asyncio.run(run())
+
+    assert inserts == [["a", "b", "c"]]
+    assert [result.id for result in results] == ["a", "b", "c"]
+
+
+def test_a_full_batch_is_flushed_without_waiting_for_the_rest():
+    inserts = []
+
+    async def run():
+        message_ingest = ingest(inserts, max_batch=2)
+        await message_ingest.start()
+        await asyncio.gather(*(message_ingest.submit(1, 2, data, DataTypeEnum.TEXT) for data in "abc"))
+        await message_ingest.stop()
+
+    asyncio.run(run())
+
+    assert inserts == [["a", "b"], ["c"]]
+
+
+def test_an_integrity_error_falls_back_to_single_rows():
+    inserts = []
+
+    async def run():
+        message_ingest = ingest(inserts, fail_on="b")
+        await message_ingest.start()
+        results = await asyncio.gather(
+            *(message_ingest.submit(1, 2, data, DataTypeEnum.TEXT) for data in "abc"),
+            return_exceptions=True,
+        )
+        await message_ingest.stop()
+        return results
+
+    good, bad, other = asyncio.run(run())
+
+    assert inserts == [["a", "b", "c"], ["a"], ["b"], ["c"]]
+    assert (good.id, other.id) == ("a", "c")
+    assert isinstance(bad, IntegrityError)
+
+
+def test_stop_lets_the_batch_in_flight_finish():
+    inserts = []
+
+    async def run():
+        message_ingest = ingest(inserts)
+        written = message_ingest._insert
+        release = asyncio.Event()
+
+        async def slow_insert(rows):
+            await release.wait()
+            return await written(rows)
+
+        message_ingest._insert = slow_insert
+        await message_ingest.start()
+
+        submitted = asyncio.ensure_future(message_ingest.submit(1, 2, "a", DataTypeEnum.TEXT))
+        await asyncio.sleep(0.05)
+        late = asyncio.ensure_future(message_ingest.submit(1, 2, "b", DataTypeEnum.TEXT))
+        await asyncio.sleep(0)
+
+        stopping = asyncio.ensure_future(message_ingest.stop())
+        await asyncio.sleep(0)
+        release.set()
+        await stopping
+
+        return submitted.result(), late.result()
+
+    first, second = asyncio.run(run())
+
+    assert inserts == [["a"], ["b"]]
+    assert (first.id, second.id) == ("a", "b")
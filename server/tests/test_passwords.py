@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+import pytest
+
+from auth.exceptions import PasswordHasherBusyError
+from auth.utils import PasswordHasher, hash_password, legacy_hash_password, verify_password
+
+
+def test_current_hash_matches_without_rehash():
+    hashed = hash_password("secret")
+
+    assert hashed.startswith("scrypt$")
+    assert verify_password("alice", "secret", hashed) == (True, False)
+    assert verify_password("alice", "wrong", hashed) == (False, False)
+
+
+def test_legacy_hash_matches_and_asks_for_an_upgrade():
+    hashed = legacy_hash_password("alice", "secret")
+
+    assert verify_password("alice", "secret", hashed) == (True, True)
+    assert verify_password("alice", "wrong", hashed) == (False, False)
+    assert verify_password("bob", "secret", hashed) == (False, False)
+
+
+def test_outdated_parameters_ask_for_a_rehash_only_on_a_match():
+    hashed = hash_password("secret", n=16, r=1, p=1)
+
+    assert verify_password("alice", "secret", hashed) == (True, True)
+    assert verify_password("alice", "wrong", hashed) == (False, False)
+
+
+def test_salts_differ_between_hashes():
+    assert hash_password("secret", n=16) != hash_password("secret", n=16)
+
+
+def test_hasher_verifies_and_upgrades_a_legacy_hash():
+    async def run():
+        hasher = PasswordHasher(max_workers=1, max_pending=0)
+        matches, needs_rehash = await hasher.verify("alice", "secret", legacy_hash_password("alice", "secret"))
+        upgraded = await hasher.hash("secret")
+        return matches, needs_rehash, await hasher.verify("alice", "secret", upgraded)
+
+    assert asyncio.run(run()) == (True, True, (True, False))
+
+
+def test_hasher_rejects_work_beyond_its_backlog():
+    release = threading.Event()
+
+    def blocked(*args):
+        release.wait()
+        return True
+
+    async def run():
+        hasher = PasswordHasher(max_workers=1, max_pending=1)
+        running = [asyncio.ensure_future(hasher._run(blocked)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        with pytest.raises(PasswordHasherBusyError):
+            await hasher._run(blocked)
+
+        release.set()
+        results = await asyncio.gather(*running)
+        return results, hasher.pending
+
+    assert asyncio.run(run()) == ([True, True], 0)
@@ -0,0 +1,41 @@
+import asyncio
+import datetime
+
+import pytest
+
+from database import database
+from services.presence.core import PresenceTracker
+
+
+class FailingSession:
+
+    def __init__(self, on_execute):
+        self.on_execute = on_execute
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, statement):
+        self.on_execute()
+        raise ConnectionError("connection lost")
+
+
+def test_failed_flush_keeps_pending_timestamps_without_overwriting_newer_ones(monkeypatch):
+    earlier = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    later = earlier + datetime.timedelta(seconds=30)
+
+    tracker = PresenceTracker(socket_manager=None)
+    tracker._pending = {1: earlier, 2: earlier}
+
+    def active_again():
+        # User 2 shows activity while the UPDATE is in flight
+        tracker._pending[2] = later
+
+    monkeypatch.setattr(database, "async_session", lambda: FailingSession(active_again))
+    with pytest.raises(ConnectionError):
+        asyncio.run(tracker.flush())
+
+    assert tracker._pending == {1: earlier, 2: later}
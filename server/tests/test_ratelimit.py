@@ -0,0 +1,58 @@
+import pytest
+
+from services.ratelimit import core
+from services.ratelimit.core import TokenBucketLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(core.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_burst_then_reject_with_retry_after(clock):
+    limiter = TokenBucketLimiter("test", rate=2, burst=3, shards=4, max_keys=100)
+
+    assert [limiter.acquire("user") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("user") == pytest.approx(0.5)
+
+
+def test_tokens_refill_at_rate(clock):
+    limiter = TokenBucketLimiter("test", rate=2, burst=3, shards=4, max_keys=100)
+    for _ in range(3):
+        limiter.acquire("user")
+
+    clock[0] += 0.5
+    assert limiter.acquire("user") == 0.0
+    assert limiter.acquire("user") > 0
+
+
+def test_keys_have_separate_buckets(clock):
+    limiter = TokenBucketLimiter("test", rate=1, burst=1, shards=4, max_keys=100)
+
+    assert limiter.acquire("a") == 0.0
+    assert limiter.acquire("b") == 0.0
+    assert limiter.acquire("a") > 0
+
+
+def test_cost_is_charged_at_once(clock):
+    limiter = TokenBucketLimiter("test", rate=1, burst=5, shards=1, max_keys=100)
+
+    assert limiter.acquire("user", cost=5) == 0.0
+    assert limiter.acquire("user", cost=2) == pytest.approx(2.0)
+
+
+def test_zero_rate_disables_the_limiter(clock):
+    limiter = TokenBucketLimiter("test", rate=0, burst=0, shards=1, max_keys=100)
+
+    assert all(limiter.acquire("user") == 0.0 for _ in range(100))
+    assert len(limiter) == 0
+
+
+def test_shard_size_stays_bounded(clock):
+    limiter = TokenBucketLimiter("test", rate=1, burst=1, shards=2, max_keys=10)
+    for key in range(100):
+        limiter.acquire(key)
+
+    assert len(limiter) <= 10
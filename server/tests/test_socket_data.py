@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+
+from services.sockets.core import chat_socket_manager
+from text_chat import router
+from text_chat.service import message_ingest
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.frames = []
+
+    def enqueue(self, frame):
+        self.frames.append(frame.data)
+        return True
+
+
+def handle(monkeypatch, data) -> tuple:
+    """Runs one client message through the socket handler, returns what was published and sent back."""
+    published = []
+
+    async def submit(chat_id, sender_id, message, data_type):
+        return SimpleNamespace(id=7, created_at="2024-01-01T00:00:00")
+
+    async def send_data(outbound):
+        published.append(outbound)
+
+    monkeypatch.setattr(message_ingest, "submit", submit)
+    monkeypatch.setattr(chat_socket_manager, "send_data", send_data)
+
+    connection = FakeConnection()
+    asyncio.run(router._handle_socket_data(connection, 1, 2, data))
+    return published, connection.frames
+
+
+def test_only_known_fields_are_published(monkeypatch):
+    published, frames = handle(monkeypatch, {
+        "data_type": "text",
+        "message": "hi",
+        "nonce": "abc",
+        "ref": 1,
+        "event": "resync",
+        "user_id": 99,
+    })
+
+    assert frames == []
+    assert published == [{
+        "data_type": "text",
+        "chat_id": 1,
+        "user_id": 2,
+        "nonce": "abc",
+        "message": "hi",
+        "id": 7,
+        "created_at": "2024-01-01T00:00:00",
+        "updated_at": "2024-01-01T00:00:00",
+    }]
+
+
+def test_an_oversized_nonce_is_not_echoed(monkeypatch):
+    published, _ = handle(monkeypatch, {"data_type": "text", "message": "hi", "nonce": "x" * 1000})
+
+    assert "nonce" not in published[0]
+
+
+def test_server_events_cannot_be_sent_by_clients(monkeypatch):
+    published, frames = handle(monkeypatch, {"data_type": "presence", "nonce": "abc"})
+
+    assert published == []
+    assert frames == [{"event": "error", "code": "invalid_message", "chat_id": 1, "nonce": "abc"}]
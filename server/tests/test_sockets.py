@@ -0,0 +1,63 @@
+import asyncio
+
+from services.sockets.core import SocketConnection
+from services.sockets.encoding import Frame, FrameEncoding
+
+
+class FakeWebSocket:
+
+    def __init__(self):
+        self.sent = []
+        self.close_code = None
+
+    async def send_text(self, payload):
+        self.sent.append(payload)
+
+    async def send_bytes(self, payload):
+        self.sent.append(payload)
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+def connection(policy: str, queue_size: int = 2) -> SocketConnection:
+    return SocketConnection(FakeWebSocket(), chat_id=1, user_id=2, encoding=FrameEncoding.JSON, queue_size=queue_size, overflow_policy=policy)
+
+
+def test_drop_policy_closes_a_socket_that_cannot_keep_up():
+    async def run():
+        socket = connection("drop")
+        results = [socket.enqueue(Frame({"n": n})) for n in range(3)]
+        await asyncio.sleep(0)
+        return socket, results
+
+    socket, results = asyncio.run(run())
+
+    assert results == [True, True, False]
+    assert socket.closed
+    assert socket.dropped == 1
+    assert socket.websocket.close_code == 1013
+    assert not socket.enqueue(Frame({"n": 4}))
+
+
+def test_resync_policy_replaces_the_backlog_with_one_resync_event():
+    socket = connection("resync")
+    results = [socket.enqueue(Frame({"n": n})) for n in range(3)]
+
+    assert results == [True, True, False]
+    assert not socket.closed
+    assert socket.queue.qsize() == 1
+    assert socket.queue.get_nowait().data == {"event": "resync", "chat_id": 1}
+
+
+def test_writer_sends_frames_in_order():
+    async def run():
+        socket = connection("drop", queue_size=10)
+        socket.start()
+        for n in range(3):
+            socket.enqueue(Frame({"n": n}))
+        await asyncio.sleep(0.01)
+        socket.close()
+        return socket.websocket.sent
+
+    assert asyncio.run(run()) == ['{"n": 0}', '{"n": 1}', '{"n": 2}']
@@ -0,0 +1,51 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from jose import JWTError
+
+from auth.service import UserAuth
+
+
+def test_revoked_token_is_rejected_and_others_are_not():
+    user_auth = UserAuth()
+    access_token = user_auth.create_access_token({"sub": "alice"}, timedelta(minutes=5))
+    refresh_token = user_auth.create_refresh_token("alice")
+
+    assert user_auth.decode_token(access_token) == "alice"
+    asyncio.run(user_auth.revoke_token(access_token))
+
+    with pytest.raises(JWTError):
+        user_auth.decode_token(access_token)
+    assert user_auth.decode_token(refresh_token) == "alice"
+
+
+def test_purge_rejects_tokens_issued_in_the_same_second():
+    user_auth = UserAuth()
+    access_token = user_auth.create_access_token({"sub": "alice"}, timedelta(minutes=5))
+    other_token = user_auth.create_access_token({"sub": "bob"}, timedelta(minutes=5))
+
+    asyncio.run(user_auth.purge_user_tokens("alice"))
+
+    with pytest.raises(JWTError):
+        user_auth.decode_token(access_token)
+    assert user_auth.decode_token(other_token) == "bob"
+
+
+def test_revocations_reach_other_workers():
+    published = []
+    user_auth, other_worker = UserAuth(), UserAuth()
+
+    async def hook(payload):
+        published.append(payload)
+
+    user_auth.set_invalidation_hook(hook)
+    access_token = user_auth.create_access_token({"sub": "alice"}, timedelta(minutes=5))
+    assert other_worker.decode_token(access_token) == "alice"
+
+    asyncio.run(user_auth.revoke_token(access_token))
+    for payload in published:
+        other_worker.apply_invalidation(payload)
+
+    with pytest.raises(JWTError):
+        other_worker.decode_token(access_token)
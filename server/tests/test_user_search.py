@@ -0,0 +1,73 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.dialects import postgresql
+
+from auth import router
+from auth.dependencies import get_current_user
+from auth.models import User
+from auth.service import user_search
+from database import database
+from utils.cursor import encode_cursor
+
+
+@pytest.fixture
+def client(monkeypatch):
+    searches = []
+
+    async def search(session, query, limit, fuzzy=False, cursor=None):
+        searches.append(cursor)
+        return []
+
+    async def no_session():
+        yield None
+
+    monkeypatch.setattr(user_search, "search", search)
+    app = FastAPI()
+    app.include_router(router.router)
+    app.dependency_overrides[get_current_user] = lambda: None
+    app.dependency_overrides[database.get_session] = no_session
+
+    test_client = TestClient(app)
+    test_client.searches = searches
+    return test_client
+
+
+@pytest.mark.parametrize("fuzzy, cursor, expected", [
+    (False, encode_cursor("alice"), ("alice",)),
+    (True, encode_cursor(0.5, "alice"), (0.5, "alice")),
+    (True, encode_cursor(1, "alice"), (1.0, "alice")),
+])
+def test_well_formed_cursors_are_passed_on(client, fuzzy, cursor, expected):
+    response = client.get("/search", params={"q": "alice", "fuzzy": fuzzy, "cursor": cursor})
+
+    assert response.status_code == 200
+    assert client.searches == [expected]
+
+
+@pytest.mark.parametrize("fuzzy, cursor", [
+    (False, encode_cursor(1)),
+    (False, encode_cursor("alice", "bob")),
+    (False, encode_cursor(["alice"])),
+    (True, encode_cursor("alice")),
+    (True, encode_cursor("0.5", "alice")),
+    (True, encode_cursor(True, "alice")),
+    (True, encode_cursor(0.5, 7)),
+    (False, "not-a-cursor"),
+])
+def test_malformed_cursors_are_rejected(client, fuzzy, cursor):
+    response = client.get("/search", params={"q": "alice", "fuzzy": fuzzy, "cursor": cursor})
+
+    assert response.status_code == 400
+    assert client.searches == []
+
+
+def test_prefix_scan_is_a_range_on_the_c_collated_key():
+    compiled = user_search._prefix(User.login, "al%", ("alice",)).compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+
+    assert "LIKE" not in sql
+    assert '"user".login COLLATE "C") >= %(param_1)s' in sql
+    assert '"user".login COLLATE "C") < %(param_2)s' in sql
+    assert '"user".login COLLATE "C") > %(param_3)s' in sql
+    assert [compiled.params[name] for name in ("param_1", "param_2", "param_3")] == ["al%", "al%\U0010ffff", "alice"]
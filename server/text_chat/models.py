@@ -1,8 +1,9 @@
-from typing import List
+from typing import List, Optional
 from enum import Enum
 import datetime
 
-from sqlalchemy import ForeignKey, Text, text
+from sqlalchemy import Computed, ForeignKey, Index, Text, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from models import Base, UserChat
@@ -15,6 +16,11 @@ class DataTypeEnum(Enum):
     FILE = "FILE"
 
 
+# Digest of the FileRef JSON held in `data` by file and image messages. The CASE keeps text
+# messages from ever being cast to jsonb, whatever order Postgres evaluates the filters in
+MESSAGE_FILE_DIGEST = "(CASE WHEN message.data_type IN ('FILE', 'IMAGE') THEN message.data::jsonb ->> 'digest' END)"
+
+
 class Chat(Base):
     __tablename__ = "chat"
 
@@ -25,17 +31,28 @@ class Chat(Base):
     users: Mapped[List["User"]] = relationship(secondary="user_chat", back_populates="chats")
     messages: Mapped[List["Message"]] = relationship(back_populates="chat")
 
+    # Denormalized by the message ingest stage so the chat list needs no per-chat lookups
+    last_message_id: Mapped[Optional[int]]
+    last_activity_at: Mapped[Optional[datetime.datetime]]
+
     created_at: Mapped[datetime.datetime] = mapped_column(server_default = text("TIMEZONE('utc', now())"))
     updated_at: Mapped[datetime.datetime] = mapped_column(server_default = text("TIMEZONE('utc', now())"), onupdate = datetime.datetime.now(datetime.timezone.utc))
 
 
 class Message(Base):
     __tablename__ = "message"
+    __table_args__ = (
+        Index("ix_message_chat_id_id", "chat_id", "id"), # Keyset pagination of chat history
+        Index("ix_message_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_message_file_digest", text(MESSAGE_FILE_DIGEST), postgresql_where=text("data_type IN ('FILE', 'IMAGE')")), # Download access checks
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
     data: Mapped[str] = mapped_column(Text)
     data_type: Mapped[DataTypeEnum]
+    # Generated by Postgres on insert/update, deferred so regular reads never load it
+    search_vector: Mapped[Optional[str]] = mapped_column(TSVECTOR, Computed("to_tsvector('simple', data)", persisted=True), deferred=True)
 
     sender_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
     chat_id: Mapped[int] = mapped_column(ForeignKey("chat.id"))
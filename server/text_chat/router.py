@@ -0,0 +1,327 @@
+import asyncio
+from typing import List, Optional
+
+from fastapi import APIRouter, Query, Path, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
+from jose import JWTError
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import database
+from utils.cursor import encode_cursor, decode_cursor
+
+from services.sockets.core import SocketConnection, chat_socket_manager
+from services.sockets.encoding import Frame, decode
+from services.presence.core import presence_tracker
+from services.storage.core import content_store
+from services.ratelimit.core import ws_user_limiter, ws_ip_limiter
+
+from auth.models import User
+from auth.dependencies import get_current_user
+from auth.service import user_auth
+
+from files.schema import FileRefScheme
+
+from text_chat.models import DataTypeEnum
+from text_chat.schema import MessageReadScheme, MessagePageScheme, MessageSearchHitScheme, MessageSearchScheme, ReadStateScheme, MarkReadScheme, ChatListItemScheme, LastMessageScheme, ChatMemberScheme
+from text_chat.service import message_ingest, chat_service
+
+
+router = APIRouter()
+
+# Clients send uuid4 hex nonces, anything longer is dropped rather than echoed to every member
+MAX_NONCE_LENGTH = 64
+
+
+def _client_nonce(data: dict) -> Optional[str]:
+    nonce = data.get("nonce")
+    if isinstance(nonce, str) and len(nonce) <= MAX_NONCE_LENGTH:
+        return nonce
+    return None
+
+
+def _reject(connection: SocketConnection, chat_id: int, code: str, nonce: Optional[str] = None):
+    """Error event straight to this socket, the sender matches it to its message by nonce."""
+    event = {"event": "error", "code": code, "chat_id": chat_id}
+    if nonce is not None:
+        event["nonce"] = nonce
+    connection.enqueue(Frame(event))
+
+
+async def _handle_socket_data(connection: SocketConnection, chat_id: int, user_id: int, data: any):
+    """Handles one message of a frame. Bad input and failed writes are answered with an error event, never raised."""
+    if not isinstance(data, dict):
+        _reject(connection, chat_id, "invalid_message")
+        return
+
+    nonce = _client_nonce(data)
+    # Built from known fields only: anything else the client sends, e.g. "ref" or "event", never reaches the backplane
+    outbound = {"data_type": data.get("data_type"), "chat_id": chat_id, "user_id": user_id}
+    if nonce is not None:
+        outbound["nonce"] = nonce
+
+    try:
+        if data.get("data_type") == "text":
+            if not isinstance(data.get("message"), str) or not data["message"]:
+                _reject(connection, chat_id, "invalid_message", nonce)
+                return
+
+            persisted = await message_ingest.submit(chat_id, user_id, data["message"], DataTypeEnum.TEXT)
+            outbound["message"] = data["message"]
+            outbound["id"] = persisted.id
+            outbound["created_at"] = persisted.created_at
+            outbound["updated_at"] = persisted.created_at
+
+        elif data.get("data_type") in ("file", "image"):
+            try:
+                file = FileRefScheme.model_validate(data.get("file"))
+            except ValidationError:
+                _reject(connection, chat_id, "invalid_message", nonce)
+                return
+            try:
+                stored_size = await content_store.size(file.digest)
+            except ValueError:
+                stored_size = None
+            if stored_size != file.size:
+                _reject(connection, chat_id, "file_not_found", nonce)
+                return
+
+            data_type = DataTypeEnum.IMAGE if data["data_type"] == "image" else DataTypeEnum.FILE
+            persisted = await message_ingest.submit(chat_id, user_id, file.model_dump_json(), data_type)
+            outbound["file"] = file.model_dump()
+            outbound["id"] = persisted.id
+            outbound["created_at"] = persisted.created_at
+            outbound["updated_at"] = persisted.created_at
+
+        elif data.get("data_type") == "read":
+            message_id = data.get("message_id")
+            if type(message_id) is not int:
+                _reject(connection, chat_id, "invalid_message", nonce)
+                return
+
+            async with database.async_session() as session:
+                read_state = await chat_service.mark_read(session, user_id, chat_id, message_id)
+                await session.commit()
+            if read_state is None:
+                return
+            outbound["message_id"] = read_state.last_read_message_id
+
+        else:
+            # Presence and anything else server-generated cannot be sent by clients
+            _reject(connection, chat_id, "invalid_message", nonce)
+            return
+    except Exception as e:
+        # Deadlocks, timeouts or a lost connection fail this message only, the client may send it again
+        print(f"LOGGER: ERRROR \n\nsocket message not saved: {e}\n\n")# LOG the error
+        _reject(connection, chat_id, "not_saved", nonce)
+        return
+
+    try:
+        await chat_socket_manager.send_data(outbound)
+    except Exception as e:
+        # Already stored, members get it from history on their next resync
+        print(f"LOGGER: ERRROR \n\nsocket broadcast failed: {e}\n\n")# LOG the error
+
+
+async def _authenticate_socket(token: str, chat_id: int) -> Optional[int]:
+    """Id of the token's user when they are a member of the chat, else None."""
+    try:
+        login = user_auth.decode_token(token)
+    except JWTError:
+        return None
+
+    async with database.async_session() as session:
+        user = await user_auth.get_user(login, session)
+        if user is None or not await chat_service.is_member(session, user.id, chat_id):
+            return None
+
+    return user.id
+
+
+@router.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket, chat_id: int = Query(...), token: str = Query(...)):
+    """A frame holds one message object or a JSON/msgpack list of them, as batched by clients.
+
+    `token` is the bearer access token, browsers cannot set headers on a websocket handshake.
+    """
+    user_id = await _authenticate_socket(token, chat_id)
+    if user_id is None:
+        # Closing before accept() rejects the handshake with 403
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    connection = await chat_socket_manager.connect(websocket, chat_id, user_id)
+
+    client_ip = websocket.client.host if websocket.client else "unknown"
+    shedding = False
+
+    try:
+        await presence_tracker.connected(user_id)
+
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            # Over-limit frames are dropped before decoding or touching the database
+            retry_after = ws_user_limiter.acquire(user_id) or ws_ip_limiter.acquire(client_ip)
+            if not retry_after:
+                try:
+                    data = decode(message)
+                except ValueError:
+                    _reject(connection, chat_id, "invalid_message")
+                    continue
+                batch = data if isinstance(data, list) else [data]
+                # The frame paid for one message above, the rest of a batch is charged here
+                if len(batch) > 1:
+                    retry_after = ws_user_limiter.acquire(user_id, len(batch) - 1)
+
+            if retry_after:
+                if not shedding:
+                    # One error per burst, straight to this socket and not through the backplane
+                    connection.enqueue(Frame({"event": "error", "code": "rate_limited", "chat_id": chat_id, "retry_after": round(retry_after, 3)}))
+                    shedding = True
+                continue
+            shedding = False
+
+            presence_tracker.touch(user_id)
+
+            # Every text message of a batch reaches the ingest queue, in order, before any of them awaits its commit
+            await asyncio.gather(*(_handle_socket_data(connection, chat_id, user_id, item) for item in batch))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        chat_socket_manager.disconnect(chat_id, user_id, connection)
+        await presence_tracker.disconnected(user_id)
+
+
+@router.get("/list")
+async def get_chat_list(
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(database.get_session),
+) -> List[ChatListItemScheme]:
+    chats = []
+    for row in await chat_service.get_chat_list(session, user.id):
+        last_message = None
+        if row.message_id is not None:
+            last_message = LastMessageScheme(
+                id=row.message_id,
+                data=row.message_data,
+                data_type=row.message_data_type,
+                sender_id=row.message_sender_id,
+                sender_login=row.message_sender_login,
+                created_at=row.message_created_at,
+            )
+
+        chats.append(ChatListItemScheme(
+            id=row.id,
+            name=row.name,
+            is_pinned=row.is_pinned,
+            unread_count=row.unread_count,
+            last_read_message_id=row.last_read_message_id,
+            last_activity_at=row.last_activity_at,
+            last_message=last_message,
+        ))
+
+    return chats
+
+
+@router.get("/unread")
+async def get_unread(
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(database.get_session),
+) -> List[ReadStateScheme]:
+    return [ReadStateScheme.model_validate(user_chat) for user_chat in await chat_service.get_unread(session, user.id)]
+
+
+@router.post("/{chat_id}/read")
+async def mark_read(
+    data: MarkReadScheme,
+    chat_id: int = Path(...),
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(database.get_session),
+) -> ReadStateScheme:
+    read_state = await chat_service.mark_read(session, user.id, chat_id, data.message_id)
+    if read_state is None:
+        raise HTTPException(status_code=403, detail="User is not a member of this chat")
+    await session.commit()
+
+    # Read receipt for the other members
+    await chat_socket_manager.send_data({
+        "data_type": "read",
+        "chat_id": chat_id,
+        "user_id": user.id,
+        "message_id": read_state.last_read_message_id,
+    })
+
+    return ReadStateScheme.model_validate(read_state)
+
+
+@router.get("/search")
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=256),
+    chat_id: Optional[int] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(database.get_session),
+) -> MessageSearchScheme:
+    after = None
+    if cursor is not None:
+        try:
+            rank, message_id = decode_cursor(cursor)
+            after = (float(rank), int(message_id))
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    hits = await chat_service.search(session, user.id, q, limit, chat_id, after)
+
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        last_message, last_rank = hits[-1]
+        next_cursor = encode_cursor(last_rank, last_message.id)
+
+    return MessageSearchScheme(
+        messages=[
+            MessageSearchHitScheme(**MessageReadScheme.model_validate(message).model_dump(), rank=rank)
+            for message, rank in hits
+        ],
+        next_cursor=next_cursor,
+    )
+
+
+@router.get("/{chat_id}/members")
+async def get_members(
+    chat_id: int = Path(...),
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(database.get_session),
+) -> List[ChatMemberScheme]:
+    if not await chat_service.is_member(session, user.id, chat_id):
+        raise HTTPException(status_code=403, detail="User is not a member of this chat")
+
+    return [ChatMemberScheme.model_validate(member) for member in await chat_service.get_members(session, chat_id)]
+
+
+@router.get("/{chat_id}/messages")
+async def get_messages(
+    chat_id: int = Path(...),
+    before: Optional[int] = Query(None),
+    after: Optional[int] = Query(None),
+    around: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(database.get_session),
+) -> MessagePageScheme:
+    if sum(cursor is not None for cursor in (before, after, around)) > 1:
+        raise HTTPException(status_code=400, detail="Only one of before, after or around can be set")
+
+    if not await chat_service.is_member(session, user.id, chat_id):
+        raise HTTPException(status_code=403, detail="User is not a member of this chat")
+
+    messages, has_more_before, has_more_after = await chat_service.get_history(session, chat_id, limit, before, after, around)
+
+    return MessagePageScheme(
+        messages=[MessageReadScheme.model_validate(message) for message in messages],
+        has_more_before=has_more_before,
+        has_more_after=has_more_after,
+    )
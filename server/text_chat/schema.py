@@ -0,0 +1,89 @@
+from typing import List, Optional
+import datetime
+
+from pydantic import BaseModel
+
+from text_chat.models import DataTypeEnum
+
+
+class MessageReadScheme(BaseModel):
+
+    id: int
+    chat_id: int
+    sender_id: int
+
+    data: str
+    data_type: DataTypeEnum
+
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
+
+    class Config:
+        from_attributes = True
+
+
+class MessagePageScheme(BaseModel):
+
+    messages: List[MessageReadScheme] = []
+    has_more_before: bool
+    has_more_after: bool
+
+
+class MessageSearchHitScheme(MessageReadScheme):
+
+    rank: float
+
+
+class MessageSearchScheme(BaseModel):
+
+    messages: List[MessageSearchHitScheme] = []
+    next_cursor: Optional[str] = None
+
+
+
+class ReadStateScheme(BaseModel):
+
+    chat_id: int
+    last_read_message_id: Optional[int] = None
+    unread_count: int
+
+    class Config:
+        from_attributes = True
+
+
+class MarkReadScheme(BaseModel):
+
+    message_id: int
+
+
+class LastMessageScheme(BaseModel):
+
+    id: int
+    data: str
+    data_type: DataTypeEnum
+    sender_id: int
+    sender_login: str
+    created_at: datetime.datetime
+
+
+class ChatListItemScheme(BaseModel):
+
+    id: int
+    name: str
+    is_pinned: bool
+    unread_count: int
+    last_read_message_id: Optional[int] = None
+    last_activity_at: Optional[datetime.datetime] = None
+    last_message: Optional[LastMessageScheme] = None
+
+
+class ChatMemberScheme(BaseModel):
+
+    id: int
+    login: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    avatar: str
+
+    class Config:
+        from_attributes = True
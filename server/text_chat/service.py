@@ -0,0 +1,412 @@
+import asyncio
+from typing import List, Optional, Tuple
+
+from collections import Counter
+
+from sqlalchemy import insert, select, update, exists, bindparam, func, tuple_, literal_column, text
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import database
+from config import settings
+
+from models import UserChat
+from auth.models import User
+from text_chat.models import Chat, Message, DataTypeEnum, MESSAGE_FILE_DIGEST
+
+
+# Hot queries built once, so each call only binds parameters and hits the compiled cache
+IS_MEMBER = select(
+    exists().where(UserChat.user_id == bindparam("user_id"), UserChat.chat_id == bindparam("chat_id"))
+)
+LATEST_PAGE = (
+    select(Message)
+    .where(Message.chat_id == bindparam("chat_id"))
+    .order_by(Message.id.desc())
+    .limit(bindparam("limit"))
+)
+PAGE_BEFORE = (
+    select(Message)
+    .where(Message.chat_id == bindparam("chat_id"), Message.id < bindparam("cursor"))
+    .order_by(Message.id.desc())
+    .limit(bindparam("limit"))
+)
+PAGE_AFTER = (
+    select(Message)
+    .where(Message.chat_id == bindparam("chat_id"), Message.id > bindparam("cursor"))
+    .order_by(Message.id.asc())
+    .limit(bindparam("limit"))
+)
+# Whether anything lies on the other side of a page's cursor
+ANY_AT_OR_BEFORE = select(
+    exists().where(Message.chat_id == bindparam("chat_id"), Message.id <= bindparam("cursor"))
+)
+ANY_AT_OR_AFTER = select(
+    exists().where(Message.chat_id == bindparam("chat_id"), Message.id >= bindparam("cursor"))
+)
+
+# Whether the user shares a chat with a file or image message carrying the digest, found through ix_message_file_digest
+CAN_READ_FILE = select(
+    exists().where(
+        literal_column(MESSAGE_FILE_DIGEST) == bindparam("digest"),
+        text("message.data_type IN ('FILE', 'IMAGE')"),
+        UserChat.chat_id == Message.chat_id,
+        UserChat.user_id == bindparam("user_id"),
+    )
+)
+
+CHAT_MEMBERS = (
+    select(User.id, User.login, User.first_name, User.last_name, User.avatar)
+    .join(UserChat, UserChat.user_id == User.id)
+    .where(UserChat.chat_id == bindparam("chat_id"))
+    .order_by(User.id)
+)
+
+# Bumps every other member's unread counter for a batch of messages from one sender
+INCREMENT_UNREAD = (
+    update(UserChat.__table__)
+    .where(
+        UserChat.__table__.c.chat_id == bindparam("b_chat_id"),
+        UserChat.__table__.c.user_id != bindparam("b_sender_id"),
+    )
+    .values(unread_count=UserChat.__table__.c.unread_count + bindparam("b_count"))
+)
+
+# Moves a chat's last message pointer forward, never backwards
+TOUCH_CHAT = (
+    update(Chat.__table__)
+    .where(
+        Chat.__table__.c.id == bindparam("b_chat_id"),
+        (Chat.__table__.c.last_message_id.is_(None)) | (Chat.__table__.c.last_message_id < bindparam("b_message_id")),
+    )
+    .values(
+        last_message_id=bindparam("b_message_id"),
+        last_activity_at=bindparam("b_created_at"),
+        updated_at=Chat.__table__.c.updated_at,
+    )
+)
+
+
+# Deadlock and serialization failures, the transaction was rolled back and can simply run again
+RETRYABLE_SQLSTATES = {"40P01", "40001"}
+
+
+class MessageIngest:
+    """Group-commit stage for new messages.
+
+    Messages are buffered and written with one multi-row INSERT per batch.
+    A batch is flushed once it reaches `max_batch` rows or `flush_interval`
+    seconds after its first message, whichever comes first. A single
+    flusher writes batches in arrival order, so ids within a chat follow
+    the order messages were submitted in.
+    """
+
+    def __init__(self):
+        self.max_batch = settings.message_batch_size
+        self.flush_interval = settings.message_flush_interval_ms / 1000
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        # Taken off the queue but not yet handed to a flush
+        self._batch: List[Tuple[dict, asyncio.Future]] = []
+        self._flushing: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # The flush in progress is shielded from the cancel above, its senders still get their rows
+        if self._flushing is not None:
+            await self._flushing
+            self._flushing = None
+
+        batch, self._batch = self._batch, []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            await self._flush(batch)
+
+    async def submit(self, chat_id: int, sender_id: int, data: str, data_type: DataTypeEnum) -> Row:
+        """Queues a message and waits until it is committed. Returns a row with `id` and `created_at`."""
+        future = asyncio.get_running_loop().create_future()
+        row = {
+            "chat_id": chat_id,
+            "sender_id": sender_id,
+            "data": data,
+            "data_type": data_type,
+        }
+        self._queue.put_nowait((row, future))
+
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = self._batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self._batch = []
+            self._flushing = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._flushing)
+            self._flushing = None
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]):
+        rows = [row for row, _ in batch]
+
+        try:
+            results = await self._insert_retrying(rows)
+        except IntegrityError:
+            # One bad row (unknown chat or sender) must not fail the whole batch
+            for row, future in batch:
+                await self._flush_one(row, future)
+            return
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _flush_one(self, row: dict, future: asyncio.Future):
+        try:
+            result = (await self._insert([row]))[0]
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        if not future.done():
+            future.set_result(result)
+
+    async def _insert_retrying(self, rows: List[dict]) -> List[Row]:
+        try:
+            return await self._insert(rows)
+        except DBAPIError as e:
+            if getattr(e.orig, "sqlstate", None) not in RETRYABLE_SQLSTATES:
+                raise
+
+        return await self._insert(rows)
+
+    async def _insert(self, rows: List[dict]) -> List[Row]:
+        async with database.async_session() as session:
+            result = await session.execute(
+                insert(Message).returning(Message.id, Message.created_at, sort_by_parameter_order=True),
+                rows
+            )
+            inserted = result.all()
+
+            # Rows are locked in (chat_id, sender_id) order, the same in every batch, so two
+            # concurrent flushes touching the same chats cannot deadlock each other
+            latest = {}
+            for row, message in zip(rows, inserted):
+                latest[row["chat_id"]] = message
+            await session.execute(TOUCH_CHAT, [
+                {"b_chat_id": chat_id, "b_message_id": message.id, "b_created_at": message.created_at}
+                for chat_id, message in sorted(latest.items())
+            ])
+
+            counts = Counter((row["chat_id"], row["sender_id"]) for row in rows)
+            await session.execute(INCREMENT_UNREAD, [
+                {"b_chat_id": chat_id, "b_sender_id": sender_id, "b_count": count}
+                for (chat_id, sender_id), count in sorted(counts.items())
+            ])
+
+            await session.commit()
+
+        return inserted
+
+
+class ChatService:
+
+    async def is_member(self, session: AsyncSession, user_id: int, chat_id: int) -> bool:
+        result = await session.execute(IS_MEMBER, {"user_id": user_id, "chat_id": chat_id})
+
+        return result.scalar()
+
+    async def can_read_file(self, session: AsyncSession, user_id: int, digest: str) -> bool:
+        result = await session.execute(CAN_READ_FILE, {"user_id": user_id, "digest": digest})
+
+        return result.scalar()
+
+    async def get_members(self, session: AsyncSession, chat_id: int) -> List[Row]:
+        result = await session.execute(CHAT_MEMBERS, {"chat_id": chat_id})
+        return result.all()
+
+    async def get_history(
+        self,
+        session: AsyncSession,
+        chat_id: int,
+        limit: int,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+        around: Optional[int] = None,
+    ) -> Tuple[List[Message], bool, bool]:
+        """Returns a page of messages in ascending id order plus whether more exist before and after it.
+
+        Pages are cut by `(chat_id, id)` keyset on ix_message_chat_id_id, so every
+        page costs the same index range scan regardless of how deep it is.
+        """
+        if around is not None:
+            older_limit = limit // 2
+            older, has_more_before = await self._page_before(session, chat_id, around, older_limit)
+            newer, has_more_after = await self._page_after(session, chat_id, around - 1, limit - older_limit)
+            return older + newer, has_more_before, has_more_after
+
+        if after is not None:
+            messages, has_more_after = await self._page_after(session, chat_id, after, limit)
+            has_more_before = (await session.execute(ANY_AT_OR_BEFORE, {"chat_id": chat_id, "cursor": after})).scalar()
+            return messages, has_more_before, has_more_after
+
+        messages, has_more_before = await self._page_before(session, chat_id, before, limit)
+        has_more_after = False
+        if before is not None:
+            has_more_after = (await session.execute(ANY_AT_OR_AFTER, {"chat_id": chat_id, "cursor": before})).scalar()
+        return messages, has_more_before, has_more_after
+
+    async def mark_read(self, session: AsyncSession, user_id: int, chat_id: int, message_id: int) -> Optional[UserChat]:
+        """Moves the read pointer forward and recounts what is still unread.
+
+        `message_id` is clamped to the chat's last message, so an id that does
+        not exist yet cannot push the pointer past future messages. The recount
+        only walks messages after the pointer on ix_message_chat_id_id, i.e. the
+        ones that are still unread. Returns None when the user is not a member;
+        moving the pointer backwards leaves the read state unchanged.
+        """
+        last_message_id = select(Chat.last_message_id).where(Chat.id == chat_id).scalar_subquery()
+        read_up_to = func.least(message_id, func.coalesce(last_message_id, 0))
+
+        still_unread = (
+            select(func.count())
+            .select_from(Message)
+            .where(Message.chat_id == chat_id, Message.id > read_up_to, Message.sender_id != user_id)
+            .scalar_subquery()
+        )
+
+        result = await session.execute(
+            update(UserChat)
+            .where(
+                UserChat.user_id == user_id,
+                UserChat.chat_id == chat_id,
+                func.coalesce(UserChat.last_read_message_id, 0) < read_up_to,
+            )
+            .values(last_read_message_id=read_up_to, unread_count=still_unread)
+            .returning(UserChat)
+            .execution_options(synchronize_session=False)
+        )
+        user_chat = result.scalars().first()
+        if user_chat is not None:
+            return user_chat
+
+        result = await session.execute(
+            select(UserChat).where(UserChat.user_id == user_id, UserChat.chat_id == chat_id)
+        )
+        return result.scalars().first()
+
+    async def get_unread(self, session: AsyncSession, user_id: int) -> List[UserChat]:
+        result = await session.execute(select(UserChat).where(UserChat.user_id == user_id))
+        return list(result.scalars())
+
+    async def get_chat_list(self, session: AsyncSession, user_id: int) -> List[Row]:
+        """All chats of a user with their last message, pinned chats first, then by recent activity.
+
+        One query: membership from user_chat, the last message through the
+        denormalized chat.last_message_id and its sender, no per-chat lookups.
+        """
+        result = await session.execute(
+            select(
+                Chat.id,
+                Chat.name,
+                Chat.last_activity_at,
+                UserChat.is_pinned,
+                UserChat.unread_count,
+                UserChat.last_read_message_id,
+                Message.id.label("message_id"),
+                Message.data.label("message_data"),
+                Message.data_type.label("message_data_type"),
+                Message.created_at.label("message_created_at"),
+                Message.sender_id.label("message_sender_id"),
+                User.login.label("message_sender_login"),
+            )
+            .join(UserChat, (UserChat.chat_id == Chat.id) & (UserChat.user_id == user_id))
+            .outerjoin(Message, Message.id == Chat.last_message_id)
+            .outerjoin(User, User.id == Message.sender_id)
+            .order_by(UserChat.is_pinned.desc(), Chat.last_activity_at.desc().nulls_last(), Chat.id.desc())
+        )
+        return result.all()
+
+    async def search(
+        self,
+        session: AsyncSession,
+        user_id: int,
+        query: str,
+        limit: int,
+        chat_id: Optional[int] = None,
+        cursor: Optional[Tuple[float, int]] = None,
+    ) -> List[Tuple[Message, float]]:
+        """Full-text search over text messages of the chats `user_id` belongs to.
+
+        Matches come from the GIN index on message.search_vector and are ordered
+        by (rank, id) descending; `cursor` is the (rank, id) of the last hit of
+        the previous page. Returns up to `limit + 1` hits so callers can tell
+        whether another page exists.
+        """
+        ts_query = func.websearch_to_tsquery("simple", query)
+        rank = func.ts_rank_cd(Message.search_vector, ts_query)
+
+        statement = (
+            select(Message, rank.label("rank"))
+            .join(UserChat, (UserChat.chat_id == Message.chat_id) & (UserChat.user_id == user_id))
+            .where(Message.search_vector.op("@@")(ts_query), Message.data_type == DataTypeEnum.TEXT)
+        )
+        if chat_id is not None:
+            statement = statement.where(Message.chat_id == chat_id)
+        if cursor is not None:
+            statement = statement.where(tuple_(rank, Message.id) < tuple_(*cursor))
+
+        result = await session.execute(statement.order_by(rank.desc(), Message.id.desc()).limit(limit + 1))
+        return [(message, rank) for message, rank in result.all()]
+
+    async def _page_before(self, session: AsyncSession, chat_id: int, before: Optional[int], limit: int) -> Tuple[List[Message], bool]:
+        if before is None:
+            result = await session.execute(LATEST_PAGE, {"chat_id": chat_id, "limit": limit + 1})
+        else:
+            result = await session.execute(PAGE_BEFORE, {"chat_id": chat_id, "cursor": before, "limit": limit + 1})
+        messages = list(result.scalars())
+
+        return messages[:limit][::-1], len(messages) > limit
+
+    async def _page_after(self, session: AsyncSession, chat_id: int, after: int, limit: int) -> Tuple[List[Message], bool]:
+        result = await session.execute(PAGE_AFTER, {"chat_id": chat_id, "cursor": after, "limit": limit + 1})
+        messages = list(result.scalars())
+
+        return messages[:limit], len(messages) > limit
+
+
+message_ingest = MessageIngest()
+chat_service = ChatService()
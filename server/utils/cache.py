@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a TTL.
+
+    With `maxsize=None` nothing is ever evicted before it expires; call
+    `expire()` now and then to drop expired entries nobody reads again.
+
+    Not thread safe, meant to be used from the event loop only.
+    """
+
+    def __init__(self, maxsize: Optional[int], ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable, default: any = None) -> any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: any, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+
+        while self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: any = None) -> any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def expire(self):
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._data.items() if expires_at <= now]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
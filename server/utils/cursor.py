@@ -0,0 +1,19 @@
+import base64
+import json
+
+
+def encode_cursor(*values: any) -> str:
+    """Opaque, URL-safe cursor for keyset pagination."""
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> list:
+    """Raises ValueError for anything that is not a cursor produced by encode_cursor."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception as e:
+        raise ValueError("Malformed cursor") from e
+
+    if not isinstance(values, list):
+        raise ValueError("Malformed cursor")
+    return values